@@ -2,74 +2,304 @@
 Re-writing of approximation MIP solver using Gurobi
 Created in Feb 14th. 2019 by JuneTech
 '''
+import hashlib
+import math
+from collections import OrderedDict
 from typing import Dict
 
-from gurobipy import *
+import numpy as np
 
+try:
+    from gurobipy import *
+except ImportError: ## combinatorial engine does not need Gurobi
+    pass
+
+from jobset import JobSet, as_jobset
 from problem import JobData, Problem
 
+solve_cache = OrderedDict() # (instance key, ul_flag, offset) - {i: {t: j}}, least recent first
+solve_cache_size = 64 # maximum number of solutions kept in solve_cache
+
+
+def set_solve_cache_size(size):
+    '''
+    Change maximum size of solve_cache, evicting least recent solutions
+    '''
+    global solve_cache_size
+    solve_cache_size = size
+    while len(solve_cache) > max(solve_cache_size, 0):
+        solve_cache.popitem(last=False)
+
+def instance_key(job_dict, prob: Problem):
+    '''
+    Return digest of instance content: machines, processing time and jobs
+    '''
+    jobs = as_jobset(job_dict, prob.m)
+    order = np.argsort(jobs.idx, kind="stable")
+    digest = hashlib.sha1(repr((prob.m, prob.p)).encode())
+    digest.update(jobs.idx[order].tobytes())
+    digest.update(jobs.rj[order].tobytes())
+    digest.update(np.ascontiguousarray(jobs.eligibility[order]).tobytes())
+    return digest.hexdigest()
+
+def store_cached_assignment(job_dict, prob: Problem, ul_flag, offset, mc_time_job_dict):
+    '''
+    Keep a solution of assignment problem in solve_cache
+    '''
+    if solve_cache_size <= 0 or mc_time_job_dict is None:
+        return
+    key = (instance_key(job_dict, prob), ul_flag, offset)
+    solve_cache[key] = mc_time_job_dict
+    solve_cache.move_to_end(key)
+    while len(solve_cache) > solve_cache_size:
+        solve_cache.popitem(last=False)
+
+def solve_assignment_mip(job_dict, prob: Problem, ul_flag, offset=0, disp_flag=False,
+                         engine="gurobi", sparse=False, cutoff=math.inf, cache=False):
+    '''
+    Solve assignment problem of jobs(dictionary of JobData or JobSet)
+    to machine-timeslot pairs and return {i: {t: j}} dictionary
+    - engine "gurobi": LP model solved by Gurobi
+    - engine "matrix": the same LP model built by Gurobi matrix API
+    - engine "flow": min-cost flow by assignment_flow, without a MIP solver
+    - sparse: Gurobi model without variables of infeasible triples;
+      same objective, but Gurobi may return another optimal assignment
+      when perturbated costs tie, changing IMR values
+    - cutoff: return None instead when sum of timeslots of the solution
+      is proven to exceed cutoff
+    - cache: reuse and keep the solution in solve_cache
+    '''
+    if cache:
+        key = (instance_key(job_dict, prob), ul_flag, offset)
+        if key in solve_cache:
+            solve_cache.move_to_end(key)
+            return {i: dict(time_job_dict) for i, time_job_dict in solve_cache[key].items()}
+        mc_time_job_dict = solve_assignment_mip(job_dict, prob, ul_flag, offset, disp_flag,
+                                                engine, sparse, cutoff)
+        store_cached_assignment(job_dict, prob, ul_flag, offset, mc_time_job_dict)
+        return mc_time_job_dict
+
+    if engine == "flow":
+        from assignment_flow import solve_assignment_flow
+        prob.timer.start("assignment")
+        mc_time_job_dict = solve_assignment_flow(job_dict, prob, ul_flag, offset, disp_flag, cutoff)
+        prob.timer.stop()
+        return mc_time_job_dict
+    elif engine not in ("gurobi", "matrix"):
+        print("Unknown assignment engine:", engine)
+        raise ValueError
+
+    prob.timer.start("assignment")
+    prob.timer.start("build")
+    jobs = as_jobset(job_dict, prob.m)
+    comp_time = assignment_timeslots(jobs, prob, ul_flag, offset)
+
+    model = Model("MIP with %c flag and %d offset" % (ul_flag, offset))
+    model.setParam("OutputFlag", disp_flag)
+
+    max_timeslot = max(comp_time)
+    epsilon = 1/max_timeslot
+
+    multiplier, earliest_time = assignment_job_data(jobs, prob, offset, epsilon)
+    if engine == "matrix":
+        x, var_keys = add_matrix_assignment(model, jobs, prob, comp_time, multiplier,
+                                            earliest_time, sparse)
+    elif sparse:
+        x = add_sparse_assignment(model, jobs, comp_time, multiplier, earliest_time)
+    else:
+        x = add_dense_assignment(model, jobs, prob, comp_time, multiplier, earliest_time)
+
+    if cutoff < math.inf:
+        ## perturbated cost is at most max_multiplier times the sum of timeslots
+        model.setParam("Cutoff", cutoff * float(multiplier.max()))
+
+    model.update()
+    prob.timer.stop()
+    prob.record_model_size(model)
+
+    prob.timer.start("solve")
+    model.optimize()
+    prob.timer.add_solver_counts(model)
+    prob.timer.stop()
+    if model.Status == GRB.CUTOFF:
+        prob.timer.stop()
+        return None
 
-def solve_assignment_mip(job_dict: Dict[int, JobData], prob: Problem, ul_flag, offset=0, disp_flag=False):
+    prob.timer.start("extract")
+    mc_time_job_dict = {i:{} for i in range(1, prob.m+1)}
+    if engine == "matrix":
+        for i, t, j in var_keys[np.round(x.X) == 1].tolist():
+            mc_time_job_dict[i][t] = j
+    else:
+        solution = model.getAttr('x', x)
+        for (i, t, j), value in solution.items():
+            if round(value) == 1:
+                mc_time_job_dict[i][t] = j
+    prob.timer.stop()
+    prob.timer.stop()
+
+    return mc_time_job_dict
+
+def assignment_timeslots(job_dict, prob: Problem, ul_flag, offset=0):
+    '''
+    Return sorted list of completion timeslots of the assignment problem
+    '''
+    jobs = as_jobset(job_dict, prob.m)
     n = prob.job_num()
-    rj_set = set()
-    cj_set = set()
-    rj_max = -1
+    p = prob.p
 
     if ul_flag == 'u':
-        for job in job_dict.values():
-            rj_set.add(job.rdate_mod(prob.p, offset=offset))
-        for rj in rj_set:
-            for a in range(1, n+1):
-                cj_set.add(rj + a * prob.p)
-    elif ul_flag == 'l':
-        for job in job_dict.values():
-            rj_max = max(rj_max, job.rdate_mod(prob.p, ul_flag=ul_flag))
-    
-    if ul_flag == 'u':
-        comp_time = sorted(list(cj_set))
+        ## union of {rj + a*p | a = 1..n} for modified release dates rj,
+        ## which all lie on one lattice of step p
+        base = offset % p
+        start_index = (np.unique(jobs.rdate_mod(p, offset=offset)) - base) // p + 1
+        comp_index = []
+        interval_start, interval_end = start_index[0], start_index[0] + n
+        for index in start_index[1:]:
+            if index > interval_end:
+                comp_index.append(np.arange(interval_start, interval_end))
+                interval_start = index
+            interval_end = index + n
+        comp_index.append(np.arange(interval_start, interval_end))
+        comp_time = (np.concatenate(comp_index) * p + base).tolist()
     elif ul_flag == 'l':
-        slot_count = n + int(rj_max/prob.p) + 1
-        comp_time = [(i+1)*prob.p for i in range(slot_count)]
-    job_idx = list(job_dict.keys())
-    mc_id = {i+1 for i in range(prob.m)}
+        rj_max = max(-1, int(jobs.rdate_mod(p, ul_flag=ul_flag).max()))
+        slot_count = n + int(rj_max/p) + 1
+        comp_time = [(i+1)*p for i in range(slot_count)]
 
-    model = Model("MIP with %c flag and %d offset" % (ul_flag, offset))
+    return comp_time
+
+def assignment_job_data(jobs: JobSet, prob: Problem, offset, epsilon):
+    '''
+    Return arrays of cost multiplier and earliest completion time of every job
+    '''
+    multiplier = 1 + epsilon*(jobs.rdate_margin(prob.p, offset=offset)
+                              - (jobs.degree/prob.m)) ##TODO: 이거 빼고도 한번 돌려보기
+    earliest_time = jobs.rdate_mod(prob.p, offset=offset) + prob.p
+    return multiplier, earliest_time
+
+def feasible_triples(jobs: JobSet, comp_time, multiplier, earliest_time):
+    '''
+    Yield ((i, t, j), perturbated cost) of eligible machines
+    and timeslots at or after modified release date
+    '''
+    comp_time_array = np.asarray(comp_time)
+    first_slot = np.searchsorted(comp_time_array, earliest_time)
+    for row, j in enumerate(jobs.idx.tolist()):
+        mc_el = jobs.mc_el(row)
+        row_multiplier = float(multiplier[row])
+        for t in comp_time[first_slot[row]:]:
+            cost = row_multiplier * t
+            for i in mc_el:
+                yield (i, t, j), cost
+
+def iterate_offset_assignments(job_dict, prob: Problem, offsets, disp_flag=False):
+    '''
+    Yield (offset, {i: {t: j}}) of ceiling assignment problems for each offset,
+    reusing one Gurobi model over the union of timeslots of all offsets.
+    Only objective coefficients and upper bounds change between offsets,
+    so each LP is warm-started from the basis of the previous one.
+    Objectives match separately built models, but when perturbated costs tie
+    the warm start may end at another optimal assignment(and IMR value)
+    '''
+    prob.timer.start("assignment")
+    prob.timer.start("build")
+    jobs = as_jobset(job_dict, prob.m)
+    offsets = list(offsets)
+    comp_time = {offset: assignment_timeslots(jobs, prob, 'u', offset)
+                 for offset in offsets}
+
+    ## cost of every triple feasible for each offset
+    offset_cost = {}
+    var_keys = {}
+    for offset in offsets:
+        multiplier, earliest_time = assignment_job_data(jobs, prob, offset,
+                                                        1/max(comp_time[offset]))
+        cost = dict(feasible_triples(jobs, comp_time[offset], multiplier, earliest_time))
+        var_keys.update(dict.fromkeys(cost))
+        offset_cost[offset] = cost
+
+    job_var_keys = {j: [] for j in jobs.idx.tolist()}
+    slot_var_keys = {}
+    for key in var_keys:
+        job_var_keys[key[2]].append(key)
+        slot_var_keys.setdefault(key[:2], []).append(key)
+
+    model = Model("MIP with u flag and %d offsets" % len(offsets))
     model.setParam("OutputFlag", disp_flag)
+    x = model.addVars(var_keys.keys(), lb=0, ub=1, name="i-t-j schedule")
+    model.ModelSense = GRB.MINIMIZE
+
+    ## Each job must be scheduled to one machine and one completion time
+    model.addConstrs((quicksum(x[key] for key in job_var_keys[j]) == 1)
+                     for j in job_var_keys.keys())
+
+    ## Each timeslot can have at maximum one job
+    for keys in slot_var_keys.values():
+        model.addConstr(quicksum(x[key] for key in keys) <= 1)
+
+    model.update()
+
+    var_list = list(x.values())
+    key_list = list(x.keys())
+    prob.timer.stop()
+    prob.record_model_size(model)
+    prob.timer.stop()
+
+    ## phases are closed before yield, caller runs its own phases in between
+    for offset in offsets:
+        prob.timer.start("assignment")
+        prob.timer.start("build")
+        cost = offset_cost[offset]
+        ## triples infeasible for this offset are fixed to zero
+        model.setAttr("UB", var_list, [1 if key in cost else 0 for key in key_list])
+        model.setAttr("Obj", var_list, [cost.get(key, 0) for key in key_list])
+        prob.timer.stop()
+
+        prob.timer.start("solve")
+        model.optimize()
+        prob.timer.add_solver_counts(model)
+        prob.timer.stop()
+
+        prob.timer.start("extract")
+        mc_time_job_dict = {i:{} for i in range(1, prob.m+1)}
+        for (i, t, j), value in zip(key_list, model.getAttr('x', var_list)):
+            if round(value) == 1:
+                mc_time_job_dict[i][t] = j
+        prob.timer.stop()
+        prob.timer.stop()
+
+        yield offset, mc_time_job_dict
+
+def add_dense_assignment(model, jobs: JobSet, prob: Problem, comp_time, multiplier, earliest_time):
+    '''
+    Add variables of every machine-timeslot-job triple,
+    pricing infeasible triples with big M
+    '''
+    n = prob.job_num()
+    job_idx = jobs.idx.tolist()
+    mc_id = {i+1 for i in range(prob.m)}
     x = model.addVars(mc_id, comp_time, job_idx, lb=0, ub=1,
                       name="i-t-j schedule")
-
     max_timeslot = max(comp_time)
-    epsilon = 1/max_timeslot
 
-    ## perturbated cost in assignment problem
-    c = {}
-    for i in mc_id:
-        empty_timedict = {}
-        for t in comp_time:
-            empty_jobdict = {}
-            for j in job_idx:
-                empty_jobdict[j] = t
-            empty_timedict[t] = empty_jobdict
-        c[i] = empty_timedict
-    
+    ## perturbated cost in assignment problem, timeslot x job
+    comp_time_array = np.asarray(comp_time)
+    perturbated_cost = np.outer(comp_time_array, multiplier)
+    ## jobs can not be assigned to timeslot before release time
+    is_early = earliest_time[np.newaxis, :] > comp_time_array[:, np.newaxis]
+
     big_M = max_timeslot * n + (prob.p * (n+1)*n/2)
+    c = {}
     for i in mc_id:
-        for t in comp_time:
-            for j in job_idx:
-                multiplier = 1 + epsilon*(job_dict[j].rdate_margin(prob.p, offset=offset)
-                                          - (job_dict[j].el_degree()/prob.m)) ##TODO: 이거 빼고도 한번 돌려보기
-                c[i][t][j] = multiplier * c[i][t][j]
-                ## jobs can not be assigned to uneligible machines
-                if i not in job_dict[j].mc_el:
-                    c[i][t][j] = big_M
-                ## jobs can not be assigned to timeslot before release time
-                if job_dict[j].rdate_mod(prob.p, offset=offset) + prob.p > t:
-                    c[i][t][j] = big_M
-
-    model.setObjective(quicksum(quicksum(quicksum(x[i, t, j]*c[i][t][j]
+        ## jobs can not be assigned to uneligible machines
+        is_infeasible = is_early | ~jobs.eligibility[np.newaxis, :, i-1]
+        c[i] = np.where(is_infeasible, big_M, perturbated_cost).tolist()
+
+    model.setObjective(quicksum(quicksum(quicksum(x[i, t, j]*c[i][t_no][j_no]
                                                   for i in mc_id)
-                                         for t in comp_time)
-                                for j in job_idx),
+                                         for t_no, t in enumerate(comp_time))
+                                for j_no, j in enumerate(job_idx)),
                        GRB.MINIMIZE)
 
     ## Each job must be scheduled to one machine and one completion time
@@ -82,15 +312,86 @@ def solve_assignment_mip(job_dict: Dict[int, JobData], prob: Problem, ul_flag, o
         for t in comp_time:
             model.addConstr(quicksum(x[i,t,j] for j in job_idx) <= 1)
 
-    model.update()
-    model.optimize()
+    return x
 
-    mc_time_job_dict = {i:{} for i in range(1, prob.m+1)}
-    solution = model.getAttr('x', x)
-    for i in mc_id:
-        for t in comp_time:
-            for j in job_idx:
-                if round(solution[i,t,j]) == 1:
-                    mc_time_job_dict[i][t] = j
+def add_sparse_assignment(model, jobs: JobSet, comp_time, multiplier, earliest_time):
+    '''
+    Add variables only for triples of eligible machines
+    and timeslots at or after modified release date
+    Variable order differs from the dense model, so among tied optimal
+    assignments Gurobi may choose another one(and IMR value may change)
+    '''
+    c = dict(feasible_triples(jobs, comp_time, multiplier, earliest_time))
+    job_var_keys = {j: [] for j in jobs.idx.tolist()}
+    slot_var_keys = {}
+    for key in c:
+        job_var_keys[key[2]].append(key)
+        slot_var_keys.setdefault(key[:2], []).append(key)
 
-    return mc_time_job_dict
+    x = model.addVars(c.keys(), lb=0, ub=1, name="i-t-j schedule")
+
+    model.setObjective(x.prod(c), GRB.MINIMIZE)
+
+    ## Each job must be scheduled to one machine and one completion time
+    model.addConstrs((quicksum(x[key] for key in job_var_keys[j]) == 1)
+                     for j in job_var_keys.keys())
+
+    ## Each timeslot can have at maximum one job
+    for var_keys in slot_var_keys.values():
+        model.addConstr(quicksum(x[key] for key in var_keys) <= 1)
+
+    return x
+
+def add_matrix_assignment(model, jobs: JobSet, prob: Problem, comp_time, multiplier, earliest_time,
+                          sparse):
+    '''
+    Add the model of add_dense_assignment or add_sparse_assignment,
+    with the same order of variables & constraints, through Gurobi matrix API
+    and return MVar with array of (i, t, j) of its variables
+    '''
+    from scipy.sparse import csr_matrix
+
+    n, m = jobs.job_num(), prob.m
+    comp_time_array = np.asarray(comp_time)
+    slot_count = len(comp_time)
+
+    ## job x timeslot x machine feasibility, job x timeslot perturbated cost
+    is_feasible = (earliest_time[:, np.newaxis] <= comp_time_array[np.newaxis, :])[:, :, np.newaxis] \
+                  & jobs.eligibility[:, np.newaxis, :]
+    perturbated_cost = np.outer(multiplier, comp_time_array)
+
+    if sparse:
+        ## variables ordered by job, timeslot & machine as in feasible_triples
+        job_no, slot_no, mc_no = np.nonzero(is_feasible)
+        cost = perturbated_cost[job_no, slot_no]
+        ## timeslot constraints in order of their first variable
+        slot_key = mc_no * slot_count + slot_no
+        unique_key, first_var, slot_row = np.unique(slot_key, return_index=True, return_inverse=True)
+        rank = np.empty(len(unique_key), dtype=np.int64)
+        rank[np.argsort(first_var, kind="stable")] = np.arange(len(unique_key))
+        slot_row = rank[slot_row]
+        slot_constr_count = len(unique_key)
+    else:
+        ## variables ordered by machine, timeslot & job as in addVars of add_dense_assignment
+        mc_no, slot_no, job_no = np.indices((m, slot_count, n)).reshape(3, -1)
+        big_M = max(comp_time) * n + (prob.p * (n+1)*n/2)
+        cost = np.where(is_feasible[job_no, slot_no, mc_no],
+                        perturbated_cost[job_no, slot_no], big_M)
+        slot_row = mc_no * slot_count + slot_no
+        slot_constr_count = m * slot_count
+
+    var_count = len(cost)
+    x = model.addMVar(var_count, lb=0, ub=1, obj=cost, name="i-t-j schedule")
+    model.ModelSense = GRB.MINIMIZE
+
+    var_no = np.arange(var_count)
+    coefficient = np.ones(var_count)
+    ## Each job must be scheduled to one machine and one completion time
+    job_matrix = csr_matrix((coefficient, (job_no, var_no)), shape=(n, var_count))
+    model.addMConstr(job_matrix, x, '=', np.ones(n))
+    ## Each timeslot can have at maximum one job
+    slot_matrix = csr_matrix((coefficient, (slot_row, var_no)), shape=(slot_constr_count, var_count))
+    model.addMConstr(slot_matrix, x, '<', np.ones(slot_constr_count))
+
+    var_keys = np.column_stack((mc_no + 1, comp_time_array[slot_no], jobs.idx[job_no]))
+    return x, var_keys
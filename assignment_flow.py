@@ -0,0 +1,170 @@
+'''
+Combinatorial solver of the assignment problem in Algorithm IMR,
+by successive shortest augmenting paths (min-cost flow) on a sparse graph
+'''
+import heapq
+import math
+
+import numpy as np
+
+from jobset import as_job_dict, as_jobset
+from problem import Problem
+
+
+def solve_assignment_flow(job_dict, prob: Problem, ul_flag, offset=0, disp_flag=False,
+                          cutoff=math.inf, perturbed=True):
+    '''
+    Solve the same assignment problem as apprx_mip.solve_assignment_mip
+    without a MIP solver and return {i: {t: j}} dictionary,
+    or None when sum of timeslots is proven to exceed cutoff
+
+    Timeslots of a machine lie on a lattice of step p,
+    so slot (i, k) represents completion time base + k*p on machine i.
+    Perturbated costs of the MIP are multiplied by max_timeslot * m
+    to keep every cost an exact integer.
+    If not perturbed, cost is the timeslot itself(sum of completion times).
+    '''
+    n = prob.job_num()
+    p = prob.p
+    jobs = as_jobset(job_dict, prob.m)
+    job_dict = as_job_dict(job_dict)
+
+    if ul_flag == 'u':
+        base = offset % p
+        rj_max = int(jobs.rdate_mod(p, offset=offset).max())
+        max_timeslot = rj_max + n * p
+    elif ul_flag == 'l':
+        base = 0
+        rj_max = max(-1, int(jobs.rdate_mod(p, ul_flag=ul_flag).max()))
+        max_timeslot = (n + int(rj_max/p) + 1) * p
+
+    ## weight and earliest slot index of each job
+    if perturbed:
+        weight_array = max_timeslot * prob.m + prob.m * jobs.rdate_margin(p, offset=offset) \
+                       - jobs.degree
+    else:
+        weight_array = np.ones(jobs.job_num(), dtype=np.int64)
+    ## modified release dates lie on the lattice, earliest completion one slot later
+    first_slot_array = -((base - jobs.rdate_mod(p, offset=offset) - p) // p)
+    weight = dict(zip(jobs.idx.tolist(), weight_array.tolist()))
+    first_slot = dict(zip(jobs.idx.tolist(), first_slot_array.tolist()))
+    mc_el = {j: jobs.mc_el(row) for row, j in enumerate(jobs.idx.tolist())}
+
+    ## slot (i, k) kept at position (i-1)*slot_num + k of flat lists,
+    ## every job fitting before slot max(first slot) + n
+    slot_num = int(first_slot_array.max()) + n + 1
+    mc_start = {i: (i-1) * slot_num for i in range(1, prob.m+1)}
+    slot_time = [base + k*p for k in range(slot_num)] * prob.m # completion time of each position
+    slot_owner = [-1] * (prob.m * slot_num) # job in the slot, -1 if free
+    next_free = list(range(prob.m * slot_num)) # union-find pointers over occupied slots
+    v = [0] * (prob.m * slot_num) # dual values of slots
+    dist = [0] * (prob.m * slot_num)
+    dist_stamp = [-1] * (prob.m * slot_num) # dist valid when stamp is the augmentation number
+    final_stamp = [-1] * (prob.m * slot_num) # slot finalized in the augmentation of the stamp
+    pred = [0] * (prob.m * slot_num)
+    slot_of_job = {} # job - flat slot position
+    u = {} # dual values of jobs
+
+    def first_free_slot(position):
+        '''
+        Return flat position of the first unoccupied slot from position, same machine
+        '''
+        root = position
+        while next_free[root] != root:
+            root = next_free[root]
+        while position != root:
+            next_free[position], position = root, next_free[position]
+        return root
+
+    ## cost of partial assignments never decreases while augmenting
+    cost_cutoff = cutoff * max(weight.values())
+    total_cost = 0
+
+    ## jobs with early completion time first keeps augmenting paths short
+    job_order = sorted(job_dict.keys(), key=lambda j: (first_slot[j], -weight[j]))
+    for stamp, new_job in enumerate(job_order):
+        u[new_job] = 0
+        scanned_jobs = []
+        scanned_slots = []
+        heap = []
+        min_val = 0
+        best_sink = math.inf
+        row = new_job
+        sink = -1
+
+        while sink < 0:
+            scanned_jobs.append(row)
+            w_row = weight[row]
+            offset_row = min_val - u[row]
+            k_first = first_slot[row]
+            for i in mc_el[row]:
+                start = mc_start[i]
+                free = first_free_slot(start + k_first)
+                ## slots later than the first free one can never be on a shortest path
+                reduced = offset_row + w_row * slot_time[free] - v[free]
+                if dist_stamp[free] != stamp or reduced < dist[free]:
+                    dist[free] = reduced
+                    dist_stamp[free] = stamp
+                    pred[free] = row
+                    heapq.heappush(heap, (reduced, False, free))
+                    if reduced < best_sink:
+                        best_sink = reduced
+                ## neither can occupied slots whose cost already exceeds the best free slot;
+                ## costs grow along the machine and duals of slots are never positive
+                for position in range(start + k_first, free):
+                    cost = offset_row + w_row * slot_time[position]
+                    if cost >= best_sink:
+                        break
+                    reduced = cost - v[position]
+                    if reduced < best_sink and final_stamp[position] != stamp and \
+                       (dist_stamp[position] != stamp or reduced < dist[position]):
+                        dist[position] = reduced
+                        dist_stamp[position] = stamp
+                        pred[position] = row
+                        heapq.heappush(heap, (reduced, True, position))
+
+            while True:
+                if len(heap) == 0:
+                    print("No feasible assignment for job", new_job)
+                    raise ValueError
+                reduced, is_occupied, position = heapq.heappop(heap)
+                if final_stamp[position] != stamp and reduced == dist[position]:
+                    break
+            final_stamp[position] = stamp
+            scanned_slots.append(position)
+            min_val = reduced
+            if is_occupied:
+                row = slot_owner[position]
+            else:
+                sink = position
+        next_free[sink] = sink + 1
+        total_cost += min_val
+        if total_cost > cost_cutoff:
+            return None
+
+        ## dual update keeps every reduced cost nonnegative
+        u[new_job] += min_val
+        for row in scanned_jobs[1:]:
+            u[row] += min_val - dist[slot_of_job[row]]
+        for position in scanned_slots:
+            v[position] -= min_val - dist[position]
+
+        ## augment along the shortest path
+        position = sink
+        while True:
+            row = pred[position]
+            prev_position = slot_of_job.get(row)
+            slot_owner[position] = row
+            slot_of_job[row] = position
+            if row == new_job:
+                break
+            position = prev_position
+
+    mc_time_job_dict = {i:{} for i in range(1, prob.m+1)}
+    for j, position in slot_of_job.items():
+        mc_time_job_dict[position // slot_num + 1][slot_time[position]] = j
+
+    if disp_flag:
+        print("Assignment with %c flag and %d offset: scaled cost %d" % (ul_flag, offset, total_cost))
+
+    return mc_time_job_dict
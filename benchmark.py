@@ -0,0 +1,310 @@
+'''
+Benchmark of every solver on a fixed family of instances
+    python benchmark.py run [-o FILE] [--repeat N] [--quick]
+    python benchmark.py compare BASELINE CURRENT [--threshold R] [--min-time S]
+    python benchmark.py assignment [--jobs N ...] [--engines E ...]
+run: records wall time, peak memory and Gurobi model size
+of each solver on each instance into a JSON file; peak memory is taken
+both by tracemalloc(Python objects only) and as peak resident memory of
+a fresh process running the solver once, which includes Gurobi
+compare: flags solvers slower or larger than in the baseline file,
+exit status being 1 if any regression is found
+assignment: wall time of one ceiling assignment by each engine
+on generated instances of 20 machines
+Solver options are taken from run option file as in master_recorder
+'''
+import argparse
+import copy
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+import apprx_mip as am
+import generator
+import greedy as grs
+import imr
+import lower_bound as lb
+import reader
+from tct_parallel_mc import ParameterLists, Problem
+
+RUN_OPTION_FILENAME = "run_option_small.json"
+
+## (m, n/m) of generated instances, with p=3, dr=1, dM=0.5
+GENERATED_SIZES = [(2, 4), (4, 4), (4, 8), (8, 8), (8, 16), (16, 16)]
+QUICK_SIZES = [(2, 4), (4, 4)]
+GENERATED_COPIES = 2
+SMALL_COPIES = 4 ## instances of param_data_small in the family
+PROCESS_MEMORY_NOISE = 1 << 20 ## process memory growth in bytes ignored as noise
+
+def solver_table(param_data: ParameterLists):
+    '''
+    Return {solver name: function(jobs, prob)} of solvers to benchmark
+    '''
+    def run_optimal_mip(jobs, prob):
+        import optimal_mip as opt
+        ## MIP start of the solver as in master_recorder
+        grs.greedy_solver(jobs, prob, engine=param_data.greedy_engine)
+        return opt.solve_optimal_mip(jobs, prob, compact=param_data.optimal_compact,
+                                     timelimit=param_data.optimal_timelimit)
+
+    return {
+        "greedy": lambda jobs, prob: grs.greedy_solver(jobs, prob, engine=param_data.greedy_engine),
+        "imr": lambda jobs, prob: imr.imr_solver(jobs, prob,
+                                                 engine=param_data.assignment_engine,
+                                                 sparse=param_data.assignment_sparse,
+                                                 incremental=param_data.imr_incremental,
+                                                 prune=param_data.imr_prune,
+                                                 validation=param_data.imr_validation),
+        "floor_crude": lambda jobs, prob: lb.floor_crude(jobs, prob,
+                                                         engine=param_data.assignment_engine,
+                                                         sparse=param_data.assignment_sparse),
+        "no_eligibility": lb.no_eligibility,
+        "hall_bound": lb.hall_bound,
+        "optimal_mip": run_optimal_mip,
+    }
+
+def benchmark_instances(data_location, quick):
+    '''
+    Yield (instance name, Problem, JobSet) of the benchmark family:
+    shipped param_data_small instances, then generated instances of increasing size
+    '''
+    for dup in range(SMALL_COPIES):
+        prob = Problem(4, 4, 2, 2, 0.6, dup)
+        yield "small:" + prob.csv_filename(), prob, reader.jobset_feeder(prob, data_location)
+
+    for m, n_over_m in QUICK_SIZES if quick else GENERATED_SIZES:
+        for dup in range(GENERATED_COPIES):
+            prob = Problem(m, n_over_m, 3, 1, 0.5, dup)
+            yield "generated:" + prob.csv_filename(), prob, generator.generate_jobset(prob)
+
+def process_peak_memory():
+    '''
+    Return peak resident memory of this process in bytes, None if unavailable
+    '''
+    ## Linux ru_maxrss survives exec, so a spawned process would report
+    ## its parent's peak; VmHWM belongs to this process image only
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def process_memory_worker(solver_name, jobs, prob: Problem, param_data: ParameterLists):
+    '''
+    Run one solver in a fresh worker process
+    and return its peak resident memory and that before the run
+    '''
+    solver = solver_table(param_data)[solver_name]
+    base_memory = process_peak_memory()
+    solver(jobs, prob)
+    return process_peak_memory(), base_memory
+
+def measure_process_memory(solver_name, jobs, prob: Problem, param_data: ParameterLists):
+    '''
+    Return (peak, base) resident memory of a spawned process running solver once,
+    base being the memory of the process with modules imported
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(process_memory_worker, solver_name, jobs, prob, param_data).result()
+
+def measure(solver_name, jobs, prob: Problem, repeat, param_data: ParameterLists):
+    '''
+    Return dictionary of measured figures of solver on one instance
+    '''
+    solver = solver_table(param_data)[solver_name]
+    figures = {}
+    wall_times = []
+    try:
+        ## memory run first, also warming up imports and Gurobi environment
+        run_prob = copy.deepcopy(prob)
+        am.solve_cache.clear()
+        tracemalloc.start()
+        solver(jobs, run_prob)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        for _ in range(repeat):
+            ## every run starts without results of other runs
+            run_prob = copy.deepcopy(prob)
+            am.solve_cache.clear()
+            start = timeit.default_timer()
+            objective = solver(jobs, run_prob)
+            wall_times.append(timeit.default_timer() - start)
+
+        process_memory, base_memory = measure_process_memory(solver_name, jobs, prob, param_data)
+    except Exception as error:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        figures["error"] = type(error).__name__ + ": " + str(error)
+        return figures
+
+    figures["objective"] = objective
+    figures["wall_time"] = min(wall_times)
+    figures["peak_memory"] = peak_memory
+    figures["process_memory"] = process_memory
+    figures["process_base_memory"] = base_memory
+    figures["models"] = len(run_prob.model_stats)
+    figures["variables"] = sum(stats[1] for stats in run_prob.model_stats)
+    figures["constraints"] = sum(stats[2] for stats in run_prob.model_stats)
+    figures["nonzeros"] = sum(stats[3] for stats in run_prob.model_stats)
+    return figures
+
+def run_benchmark(output_filename, repeat, quick):
+    run_option = reader.json_return_dict(RUN_OPTION_FILENAME)
+    param_filename_data = reader.json_return_dict(run_option["param_json_filename"])
+    if os.name == "nt":
+        data_location = param_filename_data["win_data_location"]
+    else:
+        data_location = param_filename_data["linux_data_location"]
+
+    param_data = ParameterLists(param_filename_data["number_of_machines"],
+                                param_filename_data["mn_ratios"],
+                                param_filename_data["processing_times"],
+                                param_filename_data["drs"],
+                                param_filename_data["dMs"],
+                                param_filename_data["number_of_copy"])
+    param_data.add_from_runoption(run_option)
+
+    records = []
+    for instance_name, prob, jobs in benchmark_instances(data_location, quick):
+        for solver_name in solver_table(param_data):
+            record = {"solver": solver_name, "instance": instance_name,
+                      "m": prob.m, "n": prob.job_num()}
+            record.update(measure(solver_name, jobs, prob, repeat, param_data))
+            records.append(record)
+            print(solver_name, instance_name,
+                  record.get("wall_time", record.get("error")), flush=True)
+
+    result = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "platform": platform.platform(),
+              "repeat": repeat,
+              "options": {key: value for key, value in vars(param_data).items()
+                          if isinstance(value, (bool, int, float, str))},
+              "records": records}
+    with open(output_filename, 'w') as json_file:
+        json.dump(result, json_file, indent=1)
+    print(len(records), "records written to", output_filename)
+
+def compare_benchmarks(baseline_filename, current_filename, threshold, min_time):
+    '''
+    Print regressions of current against baseline and return number of them
+    '''
+    with open(baseline_filename) as json_file:
+        baseline = {(record["solver"], record["instance"]): record
+                    for record in json.load(json_file)["records"]}
+    with open(current_filename) as json_file:
+        current = json.load(json_file)["records"]
+
+    regressions = 0
+    for record in current:
+        key = (record["solver"], record["instance"])
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        messages = []
+        if "error" in record and "error" not in base:
+            messages.append("fails: " + record["error"])
+        elif "error" not in record and "error" not in base:
+            if record["wall_time"] > base["wall_time"] * (1 + threshold) and \
+               record["wall_time"] - base["wall_time"] > min_time:
+                messages.append("time %.4f -> %.4f s" % (base["wall_time"], record["wall_time"]))
+            if record["peak_memory"] > base["peak_memory"] * (1 + threshold):
+                messages.append("memory %d -> %d B" % (base["peak_memory"], record["peak_memory"]))
+            if record.get("process_memory") and base.get("process_memory"):
+                ## memory added by the solver, imports excluded
+                base_growth = base["process_memory"] - base["process_base_memory"]
+                growth = record["process_memory"] - record["process_base_memory"]
+                if growth > base_growth * (1 + threshold) and \
+                   growth - base_growth > PROCESS_MEMORY_NOISE:
+                    messages.append("process memory growth %d -> %d B" % (base_growth, growth))
+            for size in ("variables", "constraints", "nonzeros"):
+                if record[size] > base[size]:
+                    messages.append("%s %d -> %d" % (size, base[size], record[size]))
+            if record["objective"] != base["objective"]:
+                messages.append("objective %s -> %s" % (base["objective"], record["objective"]))
+        if messages:
+            regressions += 1
+            print("REGRESSION", key[0], key[1], "; ".join(messages))
+
+    print(regressions, "regressions in", len(current), "records")
+    return regressions
+
+ASSIGNMENT_MACHINES = 20
+ASSIGNMENT_JOBS = [200, 400, 600, 1000]
+
+def benchmark_assignment(job_numbers, engines, sparse):
+    '''
+    Print wall time of solve_assignment_mip of each engine
+    with offset 0 on generated instances, p=3, dr=1, dM=0.5
+    '''
+    for n in job_numbers:
+        prob = Problem(ASSIGNMENT_MACHINES, n // ASSIGNMENT_MACHINES, 3, 1, 0.5, 0)
+        jobs = generator.generate_jobset(prob)
+        for engine in engines:
+            start = timeit.default_timer()
+            try:
+                schedule = am.solve_assignment_mip(jobs, copy.deepcopy(prob), 'u', 0,
+                                                   engine=engine, sparse=sparse)
+            except Exception as error:
+                print(engine, "n=%d" % prob.job_num(), "fails:", type(error).__name__, error, flush=True)
+                continue
+            objective = sum(sum(time_job_dict) for time_job_dict in schedule.values())
+            print(engine, "n=%d" % prob.job_num(), "%.3f s" % (timeit.default_timer() - start),
+                  "objective", objective, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of scheduling solvers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run benchmark and write JSON file")
+    run_parser.add_argument("-o", "--output", default="benchmark.json")
+    run_parser.add_argument("--repeat", type=int, default=3,
+                            help="runs per solver and instance, minimum wall time is kept")
+    run_parser.add_argument("--quick", action="store_true",
+                            help="only the smallest generated instances")
+
+    compare_parser = subparsers.add_parser("compare", help="flag regressions against baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="relative increase of time or memory flagged as regression")
+    compare_parser.add_argument("--min-time", type=float, default=0.05,
+                                help="time increase in seconds ignored as noise")
+
+    assignment_parser = subparsers.add_parser("assignment",
+                                              help="time assignment engines on large instances")
+    assignment_parser.add_argument("--jobs", type=int, nargs="+", default=ASSIGNMENT_JOBS)
+    assignment_parser.add_argument("--engines", nargs="+", default=["flow", "gurobi"])
+    assignment_parser.add_argument("--sparse", action="store_true",
+                                   help="sparse Gurobi model")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_benchmark(args.output, args.repeat, args.quick)
+    elif args.command == "assignment":
+        benchmark_assignment(args.jobs, args.engines, args.sparse)
+    elif args.command == "compare":
+        if compare_benchmarks(args.baseline, args.current, args.threshold, args.min_time) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
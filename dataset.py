@@ -0,0 +1,169 @@
+'''
+Packed dataset: all instances of a parameter grid in one file,
+read through mmap without copying
+File layout:
+    magic(8 bytes) | index length(8 bytes, little endian) | JSON index | padding | arrays
+Index maps instance key(comma-joined Problem.info_key()) to
+number of machines & jobs and byte offsets of its arrays from the 8-byte aligned
+start of arrays; arrays are job numbers & release dates in int64,
+eligibility in n x m bytes
+'''
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from jobset import JobSet
+from problem import Problem
+
+MAGIC = b"TCTPACK1"
+ALIGNMENT = 8
+
+def instance_key_string(prob: Problem):
+    return ",".join(prob.info_key())
+
+class PackedDataset:
+    '''
+    Read-only packed dataset file opened with mmap
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as packed_file:
+            self.buffer = mmap.mmap(packed_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            print("Not a packed dataset file:", filename)
+            raise ValueError
+        index_length = struct.unpack_from("<Q", self.buffer, len(MAGIC))[0]
+        index_start = len(MAGIC) + 8
+        self.index = json.loads(bytes(self.buffer[index_start:index_start+index_length]))
+        self.data_start = data_start(index_length)
+
+    def __contains__(self, prob: Problem):
+        return instance_key_string(prob) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, prob: Problem):
+        '''
+        Return JobSet of the instance, arrays being views of the file
+        '''
+        try:
+            entry = self.index[instance_key_string(prob)]
+        except KeyError:
+            print("No instance", prob.info_list(), "in packed dataset", self.filename)
+            raise KeyError
+        n, m = entry["n"], entry["m"]
+        idx = np.frombuffer(self.buffer, dtype="<i8", count=n,
+                            offset=self.data_start + entry["idx"])
+        rj = np.frombuffer(self.buffer, dtype="<i8", count=n,
+                           offset=self.data_start + entry["rj"])
+        eligibility = np.frombuffer(self.buffer, dtype=bool, count=n*m,
+                                    offset=self.data_start + entry["eligibility"]).reshape(n, m)
+        return JobSet(idx, rj, eligibility)
+
+def data_start(index_length):
+    '''
+    Return byte position of arrays in the file
+    '''
+    index_end = len(MAGIC) + 8 + index_length
+    return index_end + (-index_end % ALIGNMENT)
+
+_opened_datasets = {} ## filename - PackedDataset opened in this process
+
+def open_dataset(filename) -> PackedDataset:
+    '''
+    Return PackedDataset of filename, opening it once per process
+    '''
+    if filename not in _opened_datasets:
+        _opened_datasets[filename] = PackedDataset(filename)
+    return _opened_datasets[filename]
+
+def write_packed_dataset(filename, instances):
+    '''
+    Write iterable of (Problem, JobSet) into one packed dataset file
+    '''
+    index = {}
+    blocks = []
+    position = 0
+    for prob, job_set in instances:
+        n, m = job_set.job_num(), job_set.mc_num()
+        entry = {"m": m, "n": n}
+        for name, array in (("idx", job_set.idx.astype("<i8")),
+                            ("rj", job_set.rj.astype("<i8")),
+                            ("eligibility", job_set.eligibility.astype(np.uint8))):
+            entry[name] = position
+            data = array.tobytes()
+            padding = -len(data) % ALIGNMENT
+            blocks.append(data + b"\0" * padding)
+            position += len(data) + padding
+        index[instance_key_string(prob)] = entry
+
+    index_bytes = json.dumps(index).encode()
+    padding = data_start(len(index_bytes)) - len(MAGIC) - 8 - len(index_bytes)
+
+    with open(filename, 'wb') as packed_file:
+        packed_file.write(MAGIC)
+        packed_file.write(struct.pack("<Q", len(index_bytes)))
+        packed_file.write(index_bytes + b"\0" * padding)
+        for block in blocks:
+            packed_file.write(block)
+
+def packed_dataset_filename(param_data, param_json_filename=""):
+    '''
+    Return packed dataset file of the run: param_data.packed_filename,
+    or parameter JSON filename with extension .pack when it is empty
+    '''
+    import os
+
+    if param_data.packed_filename != "":
+        return param_data.packed_filename
+    if param_json_filename == "":
+        print("No packed dataset file: set packed_filename in run option file")
+        raise ValueError
+    return os.path.splitext(param_json_filename)[0] + ".pack"
+
+def pack_directory(param_data, data_location, filename):
+    '''
+    Convert instance CSV files of every instance in param_data
+    into one packed dataset file
+    '''
+    from reader import jobset_feeder
+
+    instances = ((prob, jobset_feeder(prob, data_location))
+                 for prob in param_data.option_iterator(False, 0, 0))
+    write_packed_dataset(filename, instances)
+
+def main():
+    from tct_parallel_mc import ParameterLists
+    from reader import json_return_dict
+    RUN_OPTION_FILENAME = "run_option_small.json"
+
+    run_option = json_return_dict(RUN_OPTION_FILENAME)
+    param_filename_data_filename = run_option["param_json_filename"]
+    param_filename_data = json_return_dict(param_filename_data_filename)
+
+    import os
+
+    if os.name == "nt":
+        param_filename_data["data_location"] = param_filename_data["win_data_location"]
+    elif os.name == "posix":
+        param_filename_data["data_location"] = param_filename_data["linux_data_location"]
+
+    param_data = ParameterLists(param_filename_data["number_of_machines"],
+                                param_filename_data["mn_ratios"],
+                                param_filename_data["processing_times"],
+                                param_filename_data["drs"],
+                                param_filename_data["dMs"],
+                                param_filename_data["number_of_copy"])
+    param_data.add_from_runoption(run_option)
+
+    packed_filename = packed_dataset_filename(param_data, param_filename_data_filename)
+    pack_directory(param_data, param_filename_data["data_location"], packed_filename)
+
+    dataset = open_dataset(packed_filename)
+    print(len(dataset), "instances packed into", packed_filename)
+
+if __name__ == '__main__':
+    main()
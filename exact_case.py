@@ -0,0 +1,43 @@
+'''
+Detects instances solvable exactly by combinatorial algorithms,
+so that no MIP needs to be built for them
+'''
+import lower_bound as lb
+from assignment_flow import solve_assignment_flow
+from jobset import as_jobset
+from problem import Problem
+
+
+def analyze_instance(job_dict, prob: Problem):
+    '''
+    Return name of exactly solvable case of the instance, None if not found
+    - "single_machine": one machine, ERD sequence is optimal
+    - "full_eligibility": every job eligible on every machine,
+      ERD job to earliest available machine(no_eligibility) is optimal
+    - "aligned_release": release dates congruent modulo p,
+      so an optimal schedule uses only timeslots rj + a*p
+      and assignment of jobs to those timeslots is exact
+    '''
+    jobs = as_jobset(job_dict, prob.m)
+    if prob.m == 1:
+        return "single_machine"
+    if jobs.eligibility.all():
+        return "full_eligibility"
+    if len(jobs.offsets(prob.p)) == 1:
+        return "aligned_release"
+    return None
+
+def solve_exact_case(job_dict, prob: Problem, case):
+    '''
+    Return optimal {i: {t: j}} schedule and its total completion time
+    of an instance of the case found by analyze_instance
+    '''
+    jobs = as_jobset(job_dict, prob.m)
+    if case in ("single_machine", "full_eligibility"):
+        return lb.no_eligibility_schedule(jobs, prob)
+    elif case == "aligned_release":
+        offset = int(jobs.rj[0]) % prob.p
+        schedule = solve_assignment_flow(jobs, prob, 'u', offset, perturbed=False)
+        return schedule, sum(sum(time_job_dict) for time_job_dict in schedule.values())
+    print("Unknown exact case:", case)
+    raise ValueError
@@ -0,0 +1,97 @@
+'''
+Seeded instance generator for parameters of ParameterLists
+- release dates: uniform integers in [0, dr * n * p / (2m)]
+  (range 0..8 of m4n16p2dr2 instances in param_data_small)
+- eligibility: each machine eligible with probability dM,
+  jobs without eligible machine are sampled again
+Same parameters and seed always give the same instance
+'''
+import csv
+import hashlib
+
+import numpy as np
+
+from jobset import JobSet
+from problem import Problem
+
+
+def instance_rng(prob: Problem, seed=0):
+    '''
+    Return random generator seeded by seed and parameters of prob
+    '''
+    key = repr((seed,) + prob.info_key()).encode()
+    entropy = int.from_bytes(hashlib.sha256(key).digest()[:16], "little")
+    return np.random.default_rng(entropy)
+
+def release_date_max(prob: Problem):
+    return int(prob.dr * prob.job_num() * prob.p / (2 * prob.m))
+
+def generate_jobset(prob: Problem, seed=0) -> JobSet:
+    '''
+    Return JobSet of a random instance with parameters of prob
+    '''
+    if prob.dM <= 0:
+        print("Eligibility density must be positive:", prob.dM)
+        raise ValueError
+    rng = instance_rng(prob, seed)
+    n = prob.job_num()
+
+    rj = rng.integers(0, release_date_max(prob), size=n, endpoint=True)
+    eligibility = rng.random((n, prob.m)) < prob.dM
+    no_machine = ~eligibility.any(axis=1)
+    while no_machine.any():
+        eligibility[no_machine] = rng.random((int(no_machine.sum()), prob.m)) < prob.dM
+        no_machine = ~eligibility.any(axis=1)
+
+    return JobSet(np.arange(n), rj, eligibility)
+
+def write_instance_csv(prob: Problem, job_set: JobSet, data_location):
+    '''
+    Write instance in the CSV layout read by reader.jobinfo_feeder
+    '''
+    filename = data_location + prob.csv_filename()
+    with open(filename, 'w') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',', lineterminator='\n')
+        writer.writerow(["job_no", "release_date"] + [str(i) for i in range(1, prob.m+1)])
+        for idx, rj, eligibility in zip(job_set.idx.tolist(), job_set.rj.tolist(),
+                                        job_set.eligibility.astype(int).tolist()):
+            writer.writerow([idx, rj] + eligibility)
+
+def main():
+    from tct_parallel_mc import ParameterLists
+    from reader import json_return_dict
+    RUN_OPTION_FILENAME = "run_option_small.json"
+
+    run_option = json_return_dict(RUN_OPTION_FILENAME)
+    param_filename_data_filename = run_option["param_json_filename"]
+    param_filename_data = json_return_dict(param_filename_data_filename)
+
+    import os
+
+    if os.name == "nt":
+        param_filename_data["data_location"] = param_filename_data["win_data_location"]
+    elif os.name == "posix":
+        param_filename_data["data_location"] = param_filename_data["linux_data_location"]
+
+    param_data = ParameterLists(param_filename_data["number_of_machines"],
+                                param_filename_data["mn_ratios"],
+                                param_filename_data["processing_times"],
+                                param_filename_data["drs"],
+                                param_filename_data["dMs"],
+                                param_filename_data["number_of_copy"])
+    param_data.add_from_runoption(run_option)
+
+    ## export generated instances, never overwriting existing data files
+    from tqdm import tqdm
+    pbar = tqdm(param_data.option_iterator(False, 0, 0),
+                total=param_data.total_ins_count,
+                ascii=True)
+    for prob in pbar:
+        if os.path.exists(param_filename_data["data_location"] + prob.csv_filename()):
+            tqdm.write("Skipping existing " + prob.csv_filename())
+            continue
+        write_instance_csv(prob, generate_jobset(prob, param_data.generator_seed),
+                           param_filename_data["data_location"])
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,10 @@ Created in Feb 13th. 2019 by JuneTech
 '''
 import math
 
+import numpy as np
+
+from jobset import JobSet, as_job_dict
+from problem import EligibilityIndex
 from tct_parallel_mc import Problem
 
 
@@ -68,10 +72,45 @@ def choose_target_mc(mc_dict: dict, jobdata):
                         key=eligible_est_mc_dict.get)
     return target_mc_key
 
-def greedy_solver(job_dict, prob: Problem, disp_flag=False):
+def sort_job_idx_fast(job_dict: dict):
+    '''
+    Same list as sort_job_idx by one stable sort on (release date, eligibility degree);
+    ties keep order of job_dict like sort_job_idx does
+    '''
+    return sorted(job_dict.keys(),
+                  key=lambda job_key: (job_dict[job_key].rj, job_dict[job_key].el_degree()))
+
+def greedy_solver(job_dict, prob: Problem, disp_flag=False, engine="scan"):
     '''
     solve scheduling problem by Algorithm Greedy
     and return the objective value(= total completion time)
+    - engine "scan": original implementation
+    - engine "fast": O(n log n) sort with machine-indexed lists, same schedule
+    jobs may be given as JobSet or dictionary of JobData
+    '''
+    prob.timer.start("schedule")
+    if engine == "fast":
+        mc_time_job_dict, total_completion_time = greedy_schedule_fast(job_dict, prob)
+    elif engine == "scan":
+        mc_time_job_dict, total_completion_time = greedy_schedule(as_job_dict(job_dict), prob)
+    else:
+        print("Unknown greedy engine:", engine)
+        raise ValueError
+    prob.timer.stop()
+
+    if (prob.approx_value == -1) or (prob.approx_value > total_completion_time):
+        prob.set_approx_value(total_completion_time)
+        prob.set_approx_schedule(mc_time_job_dict)
+
+    if disp_flag:
+        from result_display import print_schedule_intervals
+        print_schedule_intervals(mc_time_job_dict, prob.p, is_tqdm=True)
+
+    return total_completion_time
+
+def greedy_schedule(job_dict, prob: Problem):
+    '''
+    Return {i: {t: j}} schedule by Algorithm Greedy and its total completion time
     '''
     mc_dict = {i:{"available_starting_time": 0, "eligible_unscheduled_count": 0}
                for i in range(1, prob.m+1)}
@@ -100,11 +139,56 @@ def greedy_solver(job_dict, prob: Problem, disp_flag=False):
         for mc_id in job_dict[job_key].mc_el:
             mc_dict[mc_id]["eligible_unscheduled_count"] -= 1
 
-    if disp_flag:
-        from result_display import print_schedule_info
-        print_schedule_info(mc_time_job_dict, prob.p, is_tqdm=True)
+    return mc_time_job_dict, total_completion_time
 
-    return total_completion_time
+def greedy_schedule_fast(job_dict, prob: Problem):
+    '''
+    Return the same schedule as greedy_schedule and its total completion time,
+    keeping starting times in a list indexed by machine number
+    and unscheduled eligible jobs in EligibilityIndex
+    '''
+    if isinstance(job_dict, JobSet):
+        jobs = job_dict
+        el_index = EligibilityIndex.from_jobset(jobs)
+        ## same order as sort_job_idx_fast: lexsort is stable with last key primary
+        order = np.lexsort((jobs.degree, jobs.rj))
+        job_sorted = zip(jobs.idx[order].tolist(), jobs.rj[order].tolist())
+    else:
+        el_index = EligibilityIndex.from_job_dict(job_dict, prob.m)
+        job_sorted = ((job_key, job_dict[job_key].rj) for job_key in sort_job_idx_fast(job_dict))
+    available_starting_time = [0] * (prob.m+1)
+
+    mc_time_job_dict = {i:{} for i in range(1, prob.m+1)}
+    total_completion_time = 0
+
+    for job_key, rj in job_sorted:
+        mc_el = el_index.machines_of(job_key)
+
+        ## earliest starting time, then fewest unscheduled eligible jobs,
+        ## then first in eligibility list as in choose_target_mc;
+        ## counts are looked up only for machines tied on starting time
+        target_mc_key = -1
+        target_start = math.inf
+        target_count = -1
+        for mc_id in mc_el:
+            start = available_starting_time[mc_id]
+            if start < target_start:
+                target_mc_key, target_start, target_count = mc_id, start, -1
+            elif start == target_start:
+                if target_count < 0:
+                    target_count = el_index.unscheduled_count(target_mc_key)
+                count = el_index.unscheduled_count(mc_id)
+                if count < target_count:
+                    target_mc_key, target_count = mc_id, count
+
+        completion_time = max(rj, available_starting_time[target_mc_key]) + prob.p
+        mc_time_job_dict[target_mc_key][completion_time] = job_key
+        total_completion_time += completion_time
+
+        available_starting_time[target_mc_key] = completion_time
+        el_index.set_scheduled(job_key)
+
+    return mc_time_job_dict, total_completion_time
 
 def main():
     from tct_parallel_mc import ParameterLists
@@ -139,5 +223,12 @@ def main():
         info = jobinfo_feeder(prob, param_filename_data["data_location"])
         greedy_solver(info, prob, disp_flag=True)
 
+        schedule, total_completion_time = greedy_schedule_fast(info, prob)
+        from result_display import validate_schedule
+        violations = validate_schedule(schedule, info, prob.m, prob.p, total_completion_time)
+        if violations:
+            print("Infeasible greedy schedule of", prob.info_list(), violations)
+            raise ValueError
+
 if __name__ == '__main__':
     main()
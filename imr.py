@@ -6,27 +6,67 @@ import math
 
 import apprx_mip as am
 import result_display as rd
+from jobset import as_job_dict, as_jobset
 from tct_parallel_mc import Problem
 
 
-def imr_solver(job_dict, prob: Problem, disp_flag=False):
+def imr_solver(job_dict, prob: Problem, disp_flag=False, engine="gurobi", sparse=False,
+               incremental=False, workers=1, threads=0, prune=False, lower_bound=-1,
+               validation="full"):
     '''
     solve scheduling problem by Algorithm IMR
     and return the objective value(= total completion time)
+    - engine: assignment problem solver, "gurobi", "matrix" or "flow"
+    - sparse: build Gurobi assignment models without infeasible variables;
+      may change IMR value when perturbated costs tie
+    - incremental: build one Gurobi model for all offsets (engine "gurobi" only);
+      may change IMR value when perturbated costs tie
+    - workers: number of processes evaluating offsets in parallel
+    - threads: Gurobi thread cap of each worker process, no cap if not positive
+    - prune: order offsets by estimate and skip offsets that cannot beat the best one
+    - lower_bound: known lower bound; remaining offsets are skipped once it is reached
+    - validation: feasibility check of modified schedules, "full", "sampled" or "off"
+    jobs may be given as JobSet or dictionary of JobData
     '''
-    prob.update_offset_set(job_dict)
+    jobs = as_jobset(job_dict, prob.m)
+    job_dict = as_job_dict(job_dict)
+    prob.update_offset_set(jobs)
+    if prune:
+        offsets = prob.ordered_offsets(jobs)
+    else:
+        offsets = list(prob.offset_set)
     best_offset_obj = math.inf
+    floor_fixed_obj = math.inf
+
+    if workers > 1:
+        parallel_results = parallel_offset_results(jobs, prob, offsets, disp_flag, engine, sparse,
+                                                   workers, threads, validation)
+    elif incremental and engine == "gurobi":
+        incremental_crudes = am.iterate_offset_assignments(jobs, prob, offsets,
+                                                           disp_flag=disp_flag)
 
     ## calculate offset-iterated ceiling first
-    for offset in prob.offset_set:
-        crude_schedule = am.solve_assignment_mip(job_dict, prob,
-                                 ul_flag='u', offset=offset,
-                                 disp_flag=disp_flag)
-        offset_obj_value, apprx_schedule = modify_crude(crude_schedule,
-                                                        job_dict,
-                                                        prob,
-                                                        offset,
-                                                        disp_flag)
+    for offset_no, offset in enumerate(offsets):
+        if best_offset_obj <= lower_bound:
+            break
+        if workers > 1:
+            offset_result = parallel_results[offset_no]
+        else:
+            if incremental and engine == "gurobi":
+                crude_schedule = next(incremental_crudes)[1]
+            else:
+                crude_schedule = am.solve_assignment_mip(jobs, prob,
+                                         ul_flag='u', offset=offset,
+                                         disp_flag=disp_flag, engine=engine, sparse=sparse,
+                                         cutoff=crude_cutoff(jobs, prob, offset,
+                                                             best_offset_obj, prune))
+            prob.timer.start("modify")
+            offset_result = modify_promising_crude(crude_schedule, jobs, job_dict, prob, offset,
+                                                   best_offset_obj, prune, disp_flag, validation)
+            prob.timer.stop()
+        if offset_result is None:
+            continue
+        offset_obj_value, apprx_schedule = offset_result
         if best_offset_obj > offset_obj_value:
             best_offset_obj = offset_obj_value
         if (prob.approx_value == -1) or (prob.approx_value > offset_obj_value):
@@ -34,51 +74,157 @@ def imr_solver(job_dict, prob: Problem, disp_flag=False):
             prob.approx_schedule = apprx_schedule
 
     ## calculate flooring second
-    crude_schedule = am.solve_assignment_mip(job_dict, prob,
-                             ul_flag='l', offset=0,
-                             disp_flag=disp_flag)
-    floor_fixed_obj, apprx_schedule = modify_crude(crude_schedule,
-                                                   job_dict,
-                                                   prob,
-                                                   0,
-                                                   disp_flag)
-    if prob.approx_value > floor_fixed_obj:
-        prob.approx_value = floor_fixed_obj
-        prob.approx_schedule = apprx_schedule
+    if best_offset_obj > lower_bound:
+        if workers > 1:
+            floor_result = parallel_results[-1]
+        else:
+            crude_schedule = am.solve_assignment_mip(jobs, prob,
+                                     ul_flag='l', offset=0,
+                                     disp_flag=disp_flag, engine=engine, sparse=sparse,
+                                     cutoff=crude_cutoff(jobs, prob, 0,
+                                                         best_offset_obj, prune),
+                                     cache=True)
+            prob.timer.start("modify")
+            floor_result = modify_promising_crude(crude_schedule, jobs, job_dict, prob, 0,
+                                                  best_offset_obj, prune, disp_flag, validation)
+            prob.timer.stop()
+        if floor_result is not None:
+            floor_fixed_obj, apprx_schedule = floor_result
+            if prob.approx_value > floor_fixed_obj:
+                prob.approx_value = floor_fixed_obj
+                prob.approx_schedule = apprx_schedule
 
     return min(best_offset_obj, floor_fixed_obj)
 
-def modify_crude(crude_dict, job_dict, prob: Problem, offset, disp_flag):
+def compaction_margin(jobs, prob: Problem, offset):
+    '''
+    Upper bound of objective decrease by modify_crude on an optimal crude schedule:
+    a job ends at most (largest release date margin) earlier than its timeslot
+    '''
+    max_margin = int(jobs.rdate_margin(prob.p, offset=offset).max())
+    return jobs.job_num() * max_margin
+
+def crude_cutoff(jobs, prob: Problem, offset, best_offset_obj, prune):
+    '''
+    Return crude objective value above which the modified schedule
+    cannot be better than best_offset_obj
+    '''
+    if not prune or best_offset_obj == math.inf:
+        return math.inf
+    return best_offset_obj + compaction_margin(jobs, prob, offset) - 1
+
+def modify_promising_crude(crude_dict, jobs, job_dict, prob: Problem, offset,
+                           best_offset_obj, prune, disp_flag, validation="full"):
+    '''
+    Return modify_crude result, or None if crude_dict was cut off
+    or cannot be modified into a schedule better than best_offset_obj;
+    jobs is JobSet of the same jobs as job_dict
+    '''
+    if crude_dict is None:
+        return None
+    cutoff = crude_cutoff(jobs, prob, offset, best_offset_obj, prune)
+    if cutoff < math.inf:
+        crude_obj = sum(sum(time_job_dict.keys()) for time_job_dict in crude_dict.values())
+        if crude_obj > cutoff:
+            return None
+    return modify_crude(crude_dict, job_dict, prob, offset, disp_flag, validation)
+
+def parallel_offset_results(jobs, prob: Problem, offsets, disp_flag, engine, sparse, workers, threads,
+                            validation="full"):
+    '''
+    Evaluate every ceiling offset and the flooring in a process pool
+    and return list of (objective value, schedule) in the order of offsets,
+    flooring being the last element
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    tasks = [('u', offset) for offset in offsets] + [('l', 0)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                             initializer=init_offset_worker,
+                             initargs=(jobs, prob, disp_flag, engine, sparse, threads, validation)) as executor:
+        ## map keeps order of tasks regardless of finish order
+        results = list(executor.map(solve_offset_worker, tasks))
+
+    ## flooring solution is shared with Z_L lower bound
+    am.store_cached_assignment(jobs, prob, 'l', 0, results[-1][0])
+
+    return [offset_result for crude_schedule, offset_result in results]
+
+_worker_instance = None ## instance data of an offset worker process
+
+def init_offset_worker(jobs, prob: Problem, disp_flag, engine, sparse, threads, validation):
+    '''
+    Keep instance data in the worker process and cap Gurobi threads
+    '''
+    global _worker_instance
+    _worker_instance = (jobs, prob, disp_flag, engine, sparse, validation)
+    if threads > 0 and engine in ("gurobi", "matrix"):
+        import gurobipy
+        gurobipy.setParam("Threads", threads)
+
+def solve_offset_worker(task):
+    '''
+    Solve assignment problem of one (ul_flag, offset) task
+    and return its crude schedule
+    with (objective value, schedule) of its modified schedule
+    '''
+    ul_flag, offset = task
+    jobs, prob, disp_flag, engine, sparse, validation = _worker_instance
+    job_dict = as_job_dict(jobs)
+    crude_schedule = am.solve_assignment_mip(jobs, prob,
+                                             ul_flag=ul_flag, offset=offset,
+                                             disp_flag=disp_flag, engine=engine, sparse=sparse)
+    return crude_schedule, modify_crude(crude_schedule, job_dict, prob, offset, disp_flag, validation)
+
+def modify_crude(crude_dict, job_dict, prob: Problem, offset, disp_flag, validation="full"):
     '''
     Make crude_dict efficient
     and return total completion time with modified schedule
+    - validation: feasibility check of modified schedule,
+      "full", "sampled"(evenly spaced part of jobs) or "off"
     '''
-    mc_time_job_dict = {}
+    new_sequence = {}
+    total_completion_time = 0
     for i in range(1, prob.m+1): ## machine iteration
-        joblist = []
-        for key, value in crude_dict[i].items():
-            joblist.append((key, value))
-        mc_time_job_dict[i] = sorted(joblist, key=lambda jobs: jobs[0])
-
-    new_sequence = {i:{} for i in range(1, i+1)}
-    for i, joblist in mc_time_job_dict.items():
+        time_job_dict = crude_dict[i]
+        machine_sequence = {}
         time_cursor = 0
-        for item in joblist:
-            one_completion_time = prob.p + max(time_cursor, 
-                                               job_dict[item[1]].rj)
-            job_dict[item[1]].cj = one_completion_time
-            time_cursor = one_completion_time
-            new_sequence[i][one_completion_time] = item[1]
-
-    rd.check_end_schedule_feasibility(new_sequence, job_dict, prob.p)
-    if disp_flag: rd.print_schedule_info(new_sequence, prob.p)
+        for t in sorted(time_job_dict):
+            job_idx = time_job_dict[t]
+            time_cursor = prob.p + max(time_cursor, job_dict[job_idx].rj)
+            machine_sequence[time_cursor] = job_idx
+            total_completion_time += time_cursor
+        new_sequence[i] = machine_sequence
 
-    total_completion_time = 0
-    for job in job_dict.values():
-        total_completion_time += job.cj
+    if validation == "full":
+        rd.check_end_schedule_feasibility(new_sequence, job_dict, prob.p)
+    elif validation == "sampled":
+        rd.check_end_schedule_feasibility(sample_schedule(new_sequence), job_dict, prob.p)
+    elif validation != "off":
+        print("Unknown validation level:", validation)
+        raise ValueError
+    if disp_flag: rd.print_schedule_intervals(new_sequence, prob.p)
 
     return total_completion_time, new_sequence
 
+SAMPLE_SIZE = 64 ## number of jobs checked by "sampled" validation
+
+def sample_schedule(mc_time_job_dict):
+    '''
+    Return part of {i: {t: j}} schedule with about SAMPLE_SIZE evenly spaced jobs
+    '''
+    job_count = sum(len(time_job_dict) for time_job_dict in mc_time_job_dict.values())
+    stride = max(1, math.ceil(job_count / SAMPLE_SIZE))
+    sampled = {}
+    position = 0
+    for i, time_job_dict in mc_time_job_dict.items():
+        sampled[i] = {}
+        for t, j in time_job_dict.items():
+            if position % stride == 0:
+                sampled[i][t] = j
+            position += 1
+    return sampled
+
 def main():
     from tct_parallel_mc import ParameterLists
     from reader import jobinfo_feeder, json_return_dict
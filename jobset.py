@@ -0,0 +1,117 @@
+'''
+Contains class JobSet: columnar representation of all jobs of an instance,
+with adapters from and to the dictionary of JobData instances
+'''
+from typing import Dict
+
+import numpy as np
+
+from problem import JobData
+
+
+class JobSet:
+    '''
+    Jobs of an instance held as arrays, row k representing k-th job
+    '''
+    def __init__(self, idx, rj, eligibility):
+        self.idx = np.asarray(idx, dtype=np.int64) # job numbers
+        self.rj = np.asarray(rj, dtype=np.int64) # release dates
+        self.eligibility = np.asarray(eligibility, dtype=bool) # n x m, column i-1 for machine i
+        self.degree = self.eligibility.sum(axis=1) # number of eligible machines
+
+        self.rdate_mod_cache: Dict = {} # (p, ul_flag, offset) - modified release dates
+        self.job_dict_cache = None # dictionary of JobData made from this JobSet
+
+    @classmethod
+    def from_job_dict(cls, job_dict: Dict[int, JobData], m):
+        '''
+        Make JobSet of job_dict, keeping order of its jobs
+        '''
+        n = len(job_dict)
+        idx = np.empty(n, dtype=np.int64)
+        rj = np.empty(n, dtype=np.int64)
+        eligibility = np.zeros((n, m), dtype=bool)
+        for row, job in enumerate(job_dict.values()):
+            idx[row] = job.idx
+            rj[row] = job.rj
+            eligibility[row, np.asarray(job.mc_el, dtype=np.int64) - 1] = True
+        job_set = cls(idx, rj, eligibility)
+        job_set.job_dict_cache = job_dict
+        return job_set
+
+    def __getstate__(self):
+        ## caches are rebuilt on demand, e.g. in worker processes
+        state = self.__dict__.copy()
+        state['rdate_mod_cache'] = {}
+        state['job_dict_cache'] = None
+        return state
+
+    def job_num(self):
+        return len(self.idx)
+
+    def mc_num(self):
+        return self.eligibility.shape[1]
+
+    def job_dict(self):
+        '''
+        Return dictionary of JobData instances with the same jobs
+        '''
+        if self.job_dict_cache is None:
+            mc_no = self.mc_num()
+            job_dict = {}
+            for row in range(self.job_num()):
+                rawrow = {str(i+1): int(self.eligibility[row, i]) for i in range(mc_no)}
+                rawrow['job_no'] = int(self.idx[row])
+                rawrow['release_date'] = int(self.rj[row])
+                job = JobData(rawrow, mc_no, 0)
+                job_dict[job.idx] = job
+            self.job_dict_cache = job_dict
+        return self.job_dict_cache
+
+    def rdate_mod(self, p, ul_flag="u", offset=0):
+        '''
+        Array of JobData.rdate_mod of every job, computed once per arguments
+        '''
+        key = (p, ul_flag, offset)
+        if key not in self.rdate_mod_cache:
+            if ul_flag == "l":
+                modified = p * ((self.rj - offset) // p) + offset
+            elif ul_flag == "u":
+                modified = p * -((offset - self.rj) // p) + offset
+            modified.setflags(write=False)
+            self.rdate_mod_cache[key] = modified
+        return self.rdate_mod_cache[key]
+
+    def rdate_margin(self, p, ul_flag="u", offset=0):
+        '''
+        Array of JobData.rdate_margin of every job
+        '''
+        return self.rdate_mod(p, ul_flag, offset) - self.rj
+
+    def offsets(self, p):
+        '''
+        Sorted array of distinct offsets (modulo p) given by release dates
+        '''
+        return np.unique(self.rj % p)
+
+    def mc_el(self, row):
+        '''
+        List of eligible machines of the job in the row
+        '''
+        return (np.flatnonzero(self.eligibility[row]) + 1).tolist()
+
+def as_jobset(jobs, m) -> JobSet:
+    '''
+    Return jobs as JobSet, converting dictionary of JobData if needed
+    '''
+    if isinstance(jobs, JobSet):
+        return jobs
+    return JobSet.from_job_dict(jobs, m)
+
+def as_job_dict(jobs) -> Dict[int, JobData]:
+    '''
+    Return jobs as dictionary of JobData, converting JobSet if needed
+    '''
+    if isinstance(jobs, JobSet):
+        return jobs.job_dict()
+    return jobs
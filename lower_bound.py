@@ -2,20 +2,23 @@
 Lower bound algorithms for parallel machine scheduling problem
 Created in Feb 14th. 2019 by JuneTech
 '''
-import operator
-from typing import Dict
+import numpy as np
 
 import apprx_mip as am
-from problem import JobData, Problem
+from jobset import as_jobset
+from problem import EligibilityIndex, Problem
 
+MAX_HALL_SUBSETS = 512 ## machine sets examined by hall_bound at most
 
-def floor_crude(job_dict, prob: Problem, disp_flag=False):
+
+def floor_crude(job_dict, prob: Problem, disp_flag=False, engine="gurobi", sparse=False):
     '''
     Crude schedule when release date is floored - maybe infeasible
     '''
     crude_schedule = am.solve_assignment_mip(job_dict, prob,
                                              ul_flag='l', offset=0,
-                                             disp_flag=disp_flag)
+                                             disp_flag=disp_flag, engine=engine, sparse=sparse,
+                                             cache=True)
     floor_obj = 0
 
     for time_job_dict in crude_schedule.values():
@@ -24,15 +27,20 @@ def floor_crude(job_dict, prob: Problem, disp_flag=False):
 
     return floor_obj
 
-def no_eligibility(job_dict: Dict[int, JobData], prob: Problem, disp_flag=False):
+def no_eligibility(job_dict, prob: Problem, disp_flag=False):
     '''
     Exact heuristic algorithm for case when no eligibility
     (Assigning ERD job to EST machine)
     '''
-    job_sorted = []
-    for job in job_dict.values():
-        job_sorted.append((job.idx, job.rj))
-    job_sorted = sorted(job_sorted, key=operator.itemgetter(1))
+    return no_eligibility_schedule(job_dict, prob, disp_flag)[1]
+
+def no_eligibility_schedule(job_dict, prob: Problem, disp_flag=False):
+    '''
+    Return {i: {t: j}} schedule of no_eligibility and its total completion time
+    '''
+    jobs = as_jobset(job_dict, prob.m)
+    order = jobs.rj.argsort(kind="stable")
+    job_sorted = zip(jobs.idx[order].tolist(), jobs.rj[order].tolist())
 
     mc_job_schedule = {i:{} for i in range(1, prob.m+1)}
     mc_timer = {i: 0 for i in range(1, prob.m+1)}
@@ -43,8 +51,66 @@ def no_eligibility(job_dict: Dict[int, JobData], prob: Problem, disp_flag=False)
             print(job_idx, releasedate)
         mc_id = min(mc_timer, key=mc_timer.get)
         mc_timer[mc_id] = prob.p + max(mc_timer[mc_id],
-                                       job_dict[job_idx].rj)
+                                       releasedate)
         mc_job_schedule[mc_id][mc_timer[mc_id]] = job_idx
         no_el_obj += mc_timer[mc_id]
 
-    return no_el_obj
+    return mc_job_schedule, no_el_obj
+
+def erd_total_completion(rj_sorted, mc_no, p):
+    '''
+    Total completion time of ERD schedule of jobs with sorted release dates
+    on mc_no identical machines - optimal as in no_eligibility
+    Job k completes at p + max(r_k, C_(k-mc_no)), so each machine serves
+    every mc_no-th job and its completions are running maxima
+    '''
+    n = len(rj_sorted)
+    if n == 0:
+        return 0
+    rows = -(-n // mc_no)
+    padded = np.full(rows * mc_no, rj_sorted[-1], dtype=np.int64)
+    padded[:n] = rj_sorted
+    position = np.arange(rows, dtype=np.int64)[:, None]
+    completion = np.maximum.accumulate(padded.reshape(rows, mc_no) - position*p, axis=0) \
+                 + (position+1)*p
+    return int(completion.reshape(-1)[:n].sum())
+
+def hall_bound(job_dict, prob: Problem, disp_flag=False):
+    '''
+    Lower bound using eligibility: jobs whose eligible machines lie in
+    machine set S only run on |S| machines, the other jobs on m machines
+    Maximum over S of ERD bound of the two parts, S being eligible
+    machine sets of jobs and all machines(same as no_eligibility)
+    '''
+    jobs = as_jobset(job_dict, prob.m)
+    order = jobs.rj.argsort(kind="stable")
+    rj_sorted = jobs.rj[order]
+
+    el_index = EligibilityIndex.from_jobset(jobs)
+    groups = el_index.mask_groups()
+    group_masks = list(groups.keys())
+    group_no = {mask: k for k, mask in enumerate(group_masks)}
+    job_group = np.array([group_no[el_index.job_mask[j]] for j in jobs.idx.tolist()],
+                         dtype=np.int64)
+    job_group_sorted = job_group[order]
+    ## Python integers beyond 62 machines
+    mask_array = np.array(group_masks, dtype=np.int64 if prob.m < 63 else object)
+    mask_sizes = [bin(mask).count("1") for mask in group_masks]
+    density = [len(groups[mask]) / size for mask, size in zip(group_masks, mask_sizes)]
+
+    candidates = sorted(range(len(group_masks)), key=lambda k: -density[k])[:MAX_HALL_SUBSETS]
+    best_obj = erd_total_completion(rj_sorted, prob.m, prob.p)
+    best_mask = -1
+    for k in candidates:
+        subset_flag = (mask_array & ~group_masks[k] == 0).astype(bool)
+        member = subset_flag[job_group_sorted]
+        obj = erd_total_completion(rj_sorted[member], mask_sizes[k], prob.p) \
+              + erd_total_completion(rj_sorted[~member], prob.m, prob.p)
+        if obj > best_obj:
+            best_obj = obj
+            best_mask = group_masks[k]
+
+    if disp_flag:
+        print("Hall bound", best_obj, "on machines",
+              [i for i in range(1, prob.m+1) if (best_mask >> i) & 1])
+    return best_obj
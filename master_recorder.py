@@ -3,21 +3,30 @@ Re-writing of solver for identical parallel machine
 with release dates, equal processing times and eligibility constraints
 Created in Feb 2nd. 2019 by JuneTech
 '''
+import contextlib
 import csv
 import datetime
+import io
 import os
 import timeit
 
 from tqdm import tqdm
 
+import apprx_mip as am
+import dataset
+import exact_case as ec
+import generator
 import greedy as grs
 import imr
 import lower_bound as lb
 import reader
 import optimal_mip as opt
+import result_display as rd
+from jobset import JobSet
 from tct_parallel_mc import ParameterLists, Problem, Result
 
 RUN_OPTION_FILENAME = "run_option_small.json"
+SCHEDULE_INFO_NAMES = ["m", "n", "n/m", "p", "dr", "dM", "dup"] ## instance fields of exported schedules
 
 def set_result_filename(basename):
     now = datetime.datetime.now()
@@ -31,26 +40,130 @@ def write_header(filename, header_list):
         writer = csv.writer(csvfile, delimiter=',', lineterminator='\n')
         writer.writerow(header_list)
 
-def row_maker(prob: Problem, data_location):
+def commit_row(csvfile, row):
+    '''
+    Append one row with a single write and force it to disk,
+    so that a crash leaves at most an unterminated last line
+    '''
+    line_buffer = io.StringIO()
+    writer = csv.writer(line_buffer, delimiter=',', lineterminator='\n')
+    writer.writerow(row)
+    csvfile.write(line_buffer.getvalue())
+    csvfile.flush()
+    os.fsync(csvfile.fileno())
+
+def finished_instance_keys(filename, key_length):
+    '''
+    Drop unterminated last line of an interrupted result file
+    and return set of info keys of instances already written in it
+    '''
+    with open(filename, 'rb+') as result_file:
+        content = result_file.read()
+        committed_length = content.rfind(b'\n') + 1
+        if committed_length < len(content):
+            result_file.truncate(committed_length)
+
+    with open(filename, 'r') as csvfile:
+        reader = csv.reader(csvfile, delimiter=',', lineterminator='\n')
+        next(reader, None) ## header
+        return {tuple(row[:key_length]) for row in reader if len(row) >= key_length}
+
+def load_instance(prob: Problem, data_location, param_data: ParameterLists):
+    '''
+    returns JobSet of the instance from the source of param_data.instance_loader
+    '''
+    if param_data.instance_loader == "dict":
+        job_dict = JobSet.from_job_dict(reader.jobinfo_feeder(prob, data_location), prob.m)
+    elif param_data.instance_loader in ("bulk", "cached"):
+        job_dict = reader.jobset_feeder(prob, data_location,
+                                        cache=param_data.instance_loader == "cached")
+    elif param_data.instance_loader == "packed":
+        job_dict = dataset.open_dataset(dataset.packed_dataset_filename(param_data)).get(prob)
+    elif param_data.instance_loader == "generate":
+        job_dict = generator.generate_jobset(prob, param_data.generator_seed)
+    else:
+        print("Unknown instance loader:", param_data.instance_loader)
+        raise ValueError
+
+    return job_dict
+
+def row_maker(prob: Problem, data_location, param_data: ParameterLists, jobs=None):
     '''
     returns list of one successful run of the solvers
+    on jobs(JobSet or dictionary of JobData), loaded by load_instance if not given
     '''
     row_timer = timeit.default_timer()
-    job_dict = reader.jobinfo_feeder(prob, data_location)
+    engine = param_data.assignment_engine
+    sparse = param_data.assignment_sparse
+    am.set_solve_cache_size(param_data.solve_cache_size)
+    if jobs is None:
+        job_dict = load_instance(prob, data_location, param_data)
+    else:
+        job_dict = jobs
     a_result = Result()
 
+    if param_data.exact_fast_path:
+        exact_timer = timeit.default_timer()
+        case = ec.analyze_instance(job_dict, prob)
+        if case is not None and param_data.full_pipeline:
+            ## every algorithm still runs for complete columns
+            a_result.exact_case = case
+        elif case is not None:
+            prob.timer.start("exact")
+            schedule, exact_obj = ec.solve_exact_case(job_dict, prob, case)
+            prob.timer.stop()
+            prob.set_approx_value(exact_obj)
+            prob.set_approx_schedule(schedule)
+            a_result.set_exact(case, exact_obj, round(timeit.default_timer() - exact_timer, 4))
+            tqdm.write("Instance solved exactly as " + case)
+            phase_list = [prob.timer.value(key) for key in param_data.header_phase]
+            return prob.info_list() + a_result.return_result_figures_list() + phase_list, \
+                   timeit.default_timer() - row_timer
+
     a_result.set_time("Grd")
-    a_result.set_UB("Grd", grs.greedy_solver(job_dict, prob))
+    prob.timer.start("Grd")
+    a_result.set_UB("Grd", grs.greedy_solver(job_dict, prob, engine=param_data.greedy_engine))
+    prob.timer.stop()
     a_result.set_time("Grd")
 
-    a_result.set_time("IMR")
-    a_result.set_UB("IMR", imr.imr_solver(job_dict, prob))
-    a_result.set_time("IMR")
+    prob.timer.start("no_el")
+    a_result.set_LB("no_el", lb.no_eligibility(job_dict, prob))
+    prob.timer.stop()
+    prob.timer.start("Hall")
+    a_result.set_LB("Hall", lb.hall_bound(job_dict, prob))
+    prob.timer.stop()
+    ## Hall bound is never below no_el and is the LB column
+    if param_data.imr_prune or not param_data.full_pipeline:
+        imr_lower_bound = a_result.LB["Hall"]
+    else:
+        imr_lower_bound = -1
 
-    tqdm.write("Algorithm GIMR finished")
+    if not param_data.full_pipeline and a_result.UB["Grd"] <= a_result.LB["Hall"]:
+        ## Greedy schedule is proven optimal by the cheap bound
+        a_result.skip_stage("IMR")
+        tqdm.write("Greedy reached lower bound - skipping IMR")
+    else:
+        a_result.set_time("IMR")
+        prob.timer.start("IMR")
+        a_result.set_UB("IMR", imr.imr_solver(job_dict, prob, engine=engine, sparse=sparse,
+                                              incremental=param_data.imr_incremental,
+                                              workers=param_data.imr_workers,
+                                              threads=param_data.imr_threads,
+                                              prune=param_data.imr_prune,
+                                              lower_bound=imr_lower_bound,
+                                              validation=param_data.imr_validation))
+        prob.timer.stop()
+        a_result.set_time("IMR")
 
-    a_result.set_LB("Z_L", lb.floor_crude(job_dict, prob))
-    a_result.set_LB("no_el", lb.no_eligibility(job_dict, prob))
+        tqdm.write("Algorithm GIMR finished")
+
+    if param_data.full_pipeline:
+        ## Z_L cannot raise LB above Hall bound, solved for its own column only
+        prob.timer.start("Z_L")
+        a_result.set_LB("Z_L", lb.floor_crude(job_dict, prob, engine=engine, sparse=sparse))
+        prob.timer.stop()
+    else:
+        a_result.skip_stage("Z_L")
     a_result.update_most_UB_LB()
 
     if a_result.ratio["GIMR-LB"] < 1:
@@ -60,17 +173,107 @@ def row_maker(prob: Problem, data_location):
     elif a_result.ratio["GIMR-LB"] == 1:
         a_result.set_opt(a_result.UB["GIMR"])
         a_result.opt_time = '-'
+        a_result.set_opt_status("skipped", 0)
+        a_result.skipped_stages.append("opt")
         tqdm.write("Skipping optimal MIP")
     else:
         tqdm.write("Starting optimal MIP")
         a_result.set_time("opt")
-        a_result.set_opt(opt.solve_optimal_mip(job_dict, prob))
+        prob.timer.start("opt")
+        a_result.set_opt(opt.solve_optimal_mip(job_dict, prob,
+                                               compact=param_data.optimal_compact,
+                                               timelimit=param_data.optimal_timelimit,
+                                               lower_bound=a_result.LB["LB"]))
+        prob.timer.stop()
         a_result.set_time("opt")
+        a_result.set_opt_status(prob.opt_status, prob.opt_gap)
         tqdm.write("Optimal MIP finished")
     
     a_result.update_UB_ratio()
 
-    return prob.info_list() + a_result.return_result_figures_list(), timeit.default_timer() - row_timer
+    ## optional breakdown columns, e.g. "IMR/assignment/solve" or "opt/solve/NodeCount"
+    phase_list = [prob.timer.value(key) for key in param_data.header_phase]
+
+    return prob.info_list() + a_result.return_result_figures_list() + phase_list, \
+           timeit.default_timer() - row_timer
+
+def export_schedule(schedule_file, prob: Problem, param_data: ParameterLists):
+    '''
+    Append best approximate schedule of prob to schedule file,
+    as JSON lines if its name ends with .jsonl and as CSV otherwise
+    '''
+    if param_data.schedule_filename.endswith(".jsonl"):
+        info = dict(zip(SCHEDULE_INFO_NAMES, prob.info_list()))
+        rd.write_schedule_jsonl(prob.approx_schedule, prob.p, schedule_file, info)
+    else:
+        rd.write_schedule_csv(prob.approx_schedule, prob.p, schedule_file, prob.info_list())
+    schedule_file.flush()
+
+def serial_rows(prob_iterator, data_location, param_data: ParameterLists):
+    '''
+    Solve instances one by one,
+    yielding (instance, result row, solving time)
+    '''
+    for idx, prob in enumerate(prob_iterator):
+        prob.set_ins_idx(idx)
+        result_row, solving_time = row_maker(prob, data_location, param_data)
+        yield prob, result_row, solving_time
+
+def batch_rows(prob_iterator, data_location, param_data: ParameterLists):
+    '''
+    Solve instances in a pool of param_data.batch_workers processes,
+    yielding (instance, result row, solving time)
+    in completion order, or in instance order if param_data.batch_ordered
+    '''
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    workers = param_data.batch_workers
+    finished = {} # instance index - finished row waiting for its turn
+    next_idx = 0
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=init_batch_worker,
+                             initargs=(param_data.batch_threads,)) as executor:
+        pending = set()
+        prob_iterator = enumerate(prob_iterator)
+        while True:
+            ## keep a few instances queued per worker
+            for idx, prob in prob_iterator:
+                prob.set_ins_idx(idx)
+                pending.add(executor.submit(batch_row_worker, prob, data_location, param_data))
+                if len(pending) >= 2 * workers:
+                    break
+            if len(pending) == 0:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                prob, result_row, solving_time = future.result()
+                if param_data.batch_ordered:
+                    finished[prob.idx] = (prob, result_row, solving_time)
+                else:
+                    yield prob, result_row, solving_time
+            while next_idx in finished:
+                yield finished.pop(next_idx)
+                next_idx += 1
+
+def init_batch_worker(threads):
+    '''
+    Cap Gurobi threads of a batch worker process
+    '''
+    if threads > 0:
+        try:
+            import gurobipy
+            gurobipy.setParam("Threads", threads)
+        except ImportError:
+            pass
+
+def batch_row_worker(prob: Problem, data_location, param_data: ParameterLists):
+    '''
+    Solve one instance in a batch worker process
+    '''
+    result_row, solving_time = row_maker(prob, data_location, param_data)
+    return prob, result_row, solving_time
 
 def main():
     start_timer = timeit.default_timer()
@@ -106,16 +309,32 @@ def main():
                                 param_filename_data["dMs"],
                                 param_filename_data["number_of_copy"])
     param_data.add_from_runoption(run_option)
+    if param_data.instance_loader == "packed":
+        param_data.packed_filename = dataset.packed_dataset_filename(param_data,
+                                                                     param_filename_data_filename)
 
     tqdm.write(param_data.total_ins_string())
 
     ## result filename set
-    result_filename = set_result_filename(param_filename_data["result_filename"])
+    if param_data.resume_filename != "" and os.path.exists(param_data.resume_filename):
+        ## continue interrupted run, skipping finished instances
+        result_filename = param_data.resume_filename
+        finished_keys = finished_instance_keys(result_filename, len(run_option["header_info"]))
+        tqdm.write("Resuming " + result_filename + " with " + str(len(finished_keys)) + " finished instances")
+    else:
+        if param_data.resume_filename != "":
+            ## resumable run started under the given name
+            result_filename = param_data.resume_filename
+            tqdm.write("Resume file " + result_filename + " not found - starting new run in it")
+        else:
+            result_filename = set_result_filename(param_filename_data["result_filename"])
+        finished_keys = set()
 
-    ## write header first for result file
-    header_list = run_option["header_info"] + run_option["header_UB"] + run_option["header_LB"] + \
-                  run_option["header_opt"] + run_option["header_ratio"] + run_option["header_comp"]
-    write_header(result_filename, header_list)
+        ## write header first for result file
+        header_list = run_option["header_info"] + run_option["header_UB"] + run_option["header_LB"] + \
+                      run_option["header_opt"] + run_option["header_ratio"] + run_option["header_comp"] + \
+                      param_data.header_phase
+        write_header(result_filename, header_list)
 
     ## send Slack message right before beginning of iterations
     if run_option["do_slack"]:
@@ -128,20 +347,34 @@ def main():
 
     ## begin iteration
     if run_option["do_slack"]:
-        pbar = tqdm(param_data.option_iterator(run_option["do_slack"], sc, slack_data),
-                    total=param_data.total_ins_count,
-                    ascii=True)
+        prob_iterator = param_data.option_iterator(run_option["do_slack"], sc, slack_data,
+                                                   skip_keys=finished_keys)
     else:
-        pbar = tqdm(param_data.option_iterator(run_option["do_slack"], 0, 0),
-                    total=param_data.total_ins_count,
-                    ascii=True)
-
-    for prob in pbar:
-        prob.set_ins_idx(param_data.solved_ins_count)
-        with open(result_filename, 'a') as csvfile:
-            writer = csv.writer(csvfile, delimiter=',', lineterminator='\n')
-            result_row, solving_time = row_maker(prob, param_filename_data["data_location"])
-            writer.writerow(result_row)
+        prob_iterator = param_data.option_iterator(run_option["do_slack"], 0, 0,
+                                                   skip_keys=finished_keys)
+
+    if param_data.batch_workers > 1:
+        solved_rows = batch_rows(prob_iterator, param_filename_data["data_location"], param_data)
+    else:
+        solved_rows = serial_rows(prob_iterator, param_filename_data["data_location"], param_data)
+
+    pbar = tqdm(solved_rows,
+                total=param_data.total_ins_count,
+                initial=len(finished_keys),
+                ascii=True)
+
+    with contextlib.ExitStack() as file_stack:
+        csvfile = file_stack.enter_context(open(result_filename, 'a'))
+        schedule_file = None
+        if param_data.schedule_filename != "":
+            schedule_file = file_stack.enter_context(open(param_data.schedule_filename, 'a'))
+            if schedule_file.tell() == 0 and not param_data.schedule_filename.endswith(".jsonl"):
+                rd.write_schedule_csv_header(schedule_file, SCHEDULE_INFO_NAMES)
+
+        for prob, result_row, solving_time in pbar:
+            commit_row(csvfile, result_row)
+            if schedule_file is not None:
+                export_schedule(schedule_file, prob, param_data)
             if run_option["do_slack"] and run_option["report_individual_run"]:
                 message_text = "Instance "+str(prob.info_list())+" took "+str(solving_time)+" seconds"
                 try:
@@ -149,7 +382,7 @@ def main():
                 except:
                     tqdm.write("Slack error-disabling messages")
                     run_option["do_slack"] = False
-        param_data.solved_ins_count += 1
+            param_data.solved_ins_count += 1
 
     ## iteration ended; terminating
     end_timer = timeit.default_timer()
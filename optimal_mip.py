@@ -6,10 +6,24 @@ from typing import Dict
 
 from gurobipy import *
 
+from jobset import as_job_dict
 from problem import JobData, Problem
 
 
-def solve_optimal_mip(job_dict: Dict[int, JobData], prob: Problem, disp_flag=False):
+def solve_optimal_mip(job_dict, prob: Problem, disp_flag=False, compact=False,
+                      timelimit=-1, lower_bound=-1):
+    '''
+    Solve the scheduling problem by time-indexed MIP
+    and return the optimal objective value
+    - compact: formulation without infeasible variables
+      and with aggregated no-overlap constraints
+    - timelimit: time limit in seconds, no limit if not positive
+    - lower_bound: known lower bound; solving stops when an incumbent reaches it
+    Schedule in prob.approx_schedule is used as MIP start,
+    and termination status is recorded in prob.opt_status & prob.opt_gap
+    '''
+    prob.timer.start("build")
+    job_dict = as_job_dict(job_dict)
     n = prob.job_num()
     rj_list = []
     cj_set = set()
@@ -39,11 +53,78 @@ def solve_optimal_mip(job_dict: Dict[int, JobData], prob: Problem, disp_flag=Fal
 
     # print(gamma_set)
 
+    model = Model("optimal MIP")
+    model.setParam("OutputFlag", disp_flag)
+
+    if compact:
+        x = add_compact_formulation(model, job_dict, prob, comp_time, gamma_set)
+    else:
+        x = add_full_formulation(model, job_dict, prob, comp_time, gamma_set)
+
+    if timelimit > 0:
+        model.setParam("TimeLimit", timelimit)
+    if lower_bound > 0:
+        model.setParam("BestObjStop", lower_bound)
+
+    model.update()
+    set_mip_start(x, prob)
+    prob.timer.stop()
+    prob.record_model_size(model)
+
+    prob.timer.start("solve")
+    model.optimize()
+    prob.timer.add_solver_counts(model)
+    prob.timer.stop()
+
+    if model.SolCount == 0:
+        prob.opt_status = "no_solution"
+        return -1
+
+    if model.Status == GRB.OPTIMAL:
+        prob.opt_status = "optimal"
+        prob.opt_gap = 0
+    elif model.Status == GRB.USER_OBJ_LIMIT and model.ObjVal <= lower_bound:
+        ## incumbent reached the lower bound, so it is optimal
+        prob.opt_status = "optimal"
+        prob.opt_gap = 0
+    elif model.Status == GRB.TIME_LIMIT:
+        prob.opt_status = "time_limit"
+        prob.opt_gap = round(model.MIPGap, 6)
+    else:
+        prob.opt_status = "status_" + str(model.Status)
+        prob.opt_gap = round(model.MIPGap, 6)
+
+    prob.timer.start("extract")
+    total_completion_time = 0
+    solution = model.getAttr('x', x)
+    for (i, t, j), value in solution.items():
+        if round(value) == 1:
+            total_completion_time += t
+    prob.timer.stop()
+
+    return total_completion_time
+
+def set_mip_start(x, prob: Problem):
+    '''
+    Use approx_schedule({i: {t: j}} with completion times) as MIP start
+    '''
+    if len(prob.approx_schedule) == 0:
+        return
+    for var in x.values():
+        var.Start = 0
+    for i, time_job_dict in prob.approx_schedule.items():
+        for t, j in time_job_dict.items():
+            if (i, t, j) in x:
+                x[i, t, j].Start = 1
+
+def add_full_formulation(model, job_dict: Dict[int, JobData], prob: Problem, comp_time, gamma_set):
+    '''
+    Add variables of every machine-timeslot-job triple,
+    fixing infeasible ones to zero by constraints
+    '''
     job_idx = list(job_dict.keys())
     mc_id = {i+1 for i in range(prob.m)}
 
-    model = Model("optimal MIP")
-    model.setParam("OutputFlag", disp_flag)
     x = model.addVars(mc_id, comp_time, job_idx, vtype=GRB.BINARY,
                       name="i-t-j schedule")
 
@@ -57,7 +138,7 @@ def solve_optimal_mip(job_dict: Dict[int, JobData], prob: Problem, disp_flag=Fal
         for t in comp_time:
             for j in job_idx:
                 ## jobs can not be assigned to uneligible machines
-                if i not in job_dict[j].mc_el:
+                if not job_dict[j].is_eligible(i):
                     model.addConstr(x[i,t,j] == 0)
                 ## jobs can not be assigned to timeslot before release time
                 if job_dict[j].rj + prob.p > t:
@@ -84,18 +165,43 @@ def solve_optimal_mip(job_dict: Dict[int, JobData], prob: Problem, disp_flag=Fal
                         ihl_sum.add(x[i,h,l])
                 model.addConstr(x[i,t,j] + ihl_sum <= 1)
 
-    model.update()
-    model.optimize()
+    return x
 
-    total_completion_time = 0
-    solution = model.getAttr('x', x)
-    for i in mc_id:
+def add_compact_formulation(model, job_dict: Dict[int, JobData], prob: Problem, comp_time, gamma_set):
+    '''
+    Add variables only for eligible machines and timeslots after release date,
+    with one no-overlap constraint per machine-timeslot pair
+    '''
+    job_var_keys = {j: [] for j in job_dict.keys()}
+    slot_var_keys = {}
+    for j, job in job_dict.items():
         for t in comp_time:
-            for j in job_idx:
-                if round(solution[i,t,j]) == 1:
-                    total_completion_time += t
+            if job.rj + prob.p > t:
+                continue
+            for i in job.mc_el:
+                job_var_keys[j].append((i, t, j))
+                slot_var_keys.setdefault((i, t), []).append((i, t, j))
 
-    return total_completion_time
+    var_keys = [key for keys in job_var_keys.values() for key in keys]
+    x = model.addVars(var_keys, vtype=GRB.BINARY, name="i-t-j schedule")
+
+    model.setObjective(quicksum(key[1] * x[key] for key in var_keys),
+                       GRB.MINIMIZE)
+
+    ## Each job must be scheduled to one machine and one completion time
+    model.addConstrs((quicksum(x[key] for key in job_var_keys[j]) == 1)
+                     for j in job_dict.keys())
+
+    ## At most one job can be processed on a machine
+    ## during the gamma window of each timeslot
+    for i in range(1, prob.m+1):
+        for t in comp_time:
+            window_keys = [key for h in gamma_set[t]
+                           for key in slot_var_keys.get((i, h), [])]
+            if len(window_keys) > 1:
+                model.addConstr(quicksum(x[key] for key in window_keys) <= 1)
+
+    return x
 
 def main():
     from tct_parallel_mc import ParameterLists
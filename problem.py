@@ -1,10 +1,62 @@
 '''
-Containts classes: Problem, Jobdata
+Containts classes: Problem, Jobdata, EligibilityIndex
 Created on Feb 14th, 2019 by JuneTech
 '''
 import math
+import timeit
 from typing import Dict, List
 
+import numpy as np
+
+
+class PhaseTimer:
+    '''
+    Accumulates seconds and counts of nested phases,
+    keyed by path of phase names joined by '/', e.g. "IMR/assignment/solve"
+    '''
+    def __init__(self):
+        self.seconds: Dict[str, float] = {} # phase path - total seconds
+        self.counts: Dict[str, float] = {} # phase path & count name - total count
+        self.stack: List = [] # (phase name, starting time) of running phases
+
+    def start(self, name):
+        self.stack.append((name, timeit.default_timer()))
+
+    def stop(self):
+        '''
+        Stop the innermost running phase and add its time
+        '''
+        end_time = timeit.default_timer()
+        key = self.current_path()
+        name, start_time = self.stack.pop()
+        self.seconds[key] = self.seconds.get(key, 0) + end_time - start_time
+
+    def current_path(self):
+        return "/".join(name for name, start_time in self.stack)
+
+    def add_count(self, name, value):
+        '''
+        Add value to count name of the running phase
+        '''
+        key = "/".join(filter(None, [self.current_path(), name]))
+        self.counts[key] = self.counts.get(key, 0) + value
+
+    def add_solver_counts(self, model):
+        '''
+        Add Gurobi Runtime, NodeCount & IterCount of an optimized model
+        '''
+        for attribute in ("Runtime", "NodeCount", "IterCount"):
+            self.add_count(attribute, model.getAttr(attribute))
+
+    def value(self, key):
+        '''
+        Return rounded seconds or count of key, '-' if it never ran
+        '''
+        if key in self.seconds:
+            return round(self.seconds[key], 6)
+        elif key in self.counts:
+            return round(self.counts[key], 6)
+        return '-'
 
 class Problem:
     '''
@@ -26,6 +78,10 @@ class Problem:
         self.time_obj_dict: Dict = {} # dictionary for exact time keeping of MIP
         self.solving_time: float = -1 # time it took to solve
         self.lower_bound: int = -1 # LB calculated by algorithm
+        self.opt_status: str = '-' # termination status of optimal MIP
+        self.opt_gap = '-' # relative MIP gap when optimal MIP terminated
+        self.model_stats: List = [] # (model name, variables, constraints, nonzeros) of built models
+        self.timer = PhaseTimer() # time & counts of solver phases
 
     def job_num(self):
         '''
@@ -56,6 +112,13 @@ class Problem:
                 self.dM,
                 self.dup]
 
+    def info_key(self):
+        '''
+        return problem parameters as tuple of strings,
+        same as info columns written in result file
+        '''
+        return tuple(str(value) for value in self.info_list())
+
     def set_ins_idx(self, _idx):
         self.idx = _idx
 
@@ -77,6 +140,15 @@ class Problem:
         '''
         self.approx_value = total_completion_time
 
+    def record_model_size(self, model):
+        '''
+        Append size of an updated Gurobi model to model_stats
+        '''
+        self.model_stats.append((model.ModelName, model.NumVars, model.NumConstrs, model.NumNZs))
+        self.timer.add_count("variables", model.NumVars)
+        self.timer.add_count("constraints", model.NumConstrs)
+        self.timer.add_count("nonzeros", model.NumNZs)
+
     def set_schedule_endtime_to_starttime(self):
         '''
         Make approx_schedule's time epoch
@@ -99,8 +171,24 @@ class Problem:
             self.approx_schedule[mc_id] = new_timejob_dict
     
     def update_offset_set(self, job_dict):
-        for job in job_dict.values():
-            self.offset_set.add(-job.rdate_margin(self.p, ul_flag="l"))
+        '''
+        Reset offset_set to distinct offsets (modulo p) given by release dates
+        of jobs, given as JobSet or dictionary of JobData
+        '''
+        from jobset import as_jobset
+        self.offset_set = set(as_jobset(job_dict, self.m).offsets(self.p).tolist())
+
+    def ordered_offsets(self, job_dict):
+        '''
+        Return offset_set as list sorted by total release date margin,
+        the smallest margin being the most promising offset
+        '''
+        from jobset import as_jobset
+        jobs = as_jobset(job_dict, self.m)
+        total_margin = {}
+        for offset in self.offset_set:
+            total_margin[offset] = int(jobs.rdate_margin(self.p, offset=offset).sum())
+        return sorted(self.offset_set, key=lambda offset: (total_margin[offset], offset))
 
 class JobData:
     '''
@@ -110,9 +198,11 @@ class JobData:
         self.idx = int(rawrow['job_no'])
         self.rj = int(rawrow['release_date'])
         self.mc_el = []
+        self.el_mask = 0 ## bit i set if machine i is eligible
         for i in range(1, mc_no+1):
             if int(rawrow[str(i)]) == 1:
                 self.mc_el.append(i)
+                self.el_mask |= 1 << i
             elif int(rawrow[str(i)]) == 0:
                 pass
             else:
@@ -137,6 +227,9 @@ class JobData:
     def el_degree(self):
         return len(self.mc_el)
 
+    def is_eligible(self, mc_id):
+        return (self.el_mask >> mc_id) & 1 == 1
+
     def show_info(self):
         return [self.idx, self.rj, self.mc_el]
     
@@ -146,7 +239,87 @@ class JobData:
             and time based on modified release date
         Return False otherwise
         '''
-        if mc_id in self.mc_el:
+        if self.is_eligible(mc_id):
             if self.rdate_mod(p, ul_flag, offset) < time:
                 return True
         return False
+
+class EligibilityIndex:
+    '''
+    Eligibility of jobs by machine, with jobs removed once scheduled
+    '''
+    def __init__(self, idx, eligibility):
+        '''
+        Build index from arrays of job numbers and n x m eligibility,
+        column i-1 for machine i
+        '''
+        eligibility = np.asarray(eligibility, dtype=bool)
+        idx = np.asarray(idx, dtype=np.int64)
+        self.m: int = eligibility.shape[1] # number of machines
+        idx_list = idx.tolist()
+
+        rows, columns = np.nonzero(eligibility)
+        machine_list = (columns + 1).tolist()
+        ends = np.cumsum(eligibility.sum(axis=1)).tolist()
+        starts = [0] + ends[:-1]
+        # job - sorted list of eligible machines
+        self.job_machines: Dict[int, List[int]] = {j: machine_list[start:end]
+                                                   for j, start, end in zip(idx_list, starts, ends)}
+
+        if self.m < 63:
+            masks = (eligibility.astype(np.int64) @ (np.int64(1) << np.arange(1, self.m+1))).tolist()
+        else:
+            masks = [0] * len(idx_list)
+            for row, mc_id in zip(rows.tolist(), machine_list):
+                masks[row] |= 1 << mc_id
+        self.job_mask: Dict[int, int] = dict(zip(idx_list, masks)) # job - bitmask of eligible machines
+
+        # machine - unscheduled eligible jobs
+        self.mc_jobs: Dict[int, set] = {i: set(idx[eligibility[:, i-1]].tolist())
+                                        for i in range(1, self.m+1)}
+
+    @classmethod
+    def from_job_dict(cls, job_dict: Dict[int, JobData], m):
+        eligibility = np.zeros((len(job_dict), m), dtype=bool)
+        rows = [row for row, job in enumerate(job_dict.values()) for i in job.mc_el]
+        columns = [i-1 for job in job_dict.values() for i in job.mc_el]
+        eligibility[rows, columns] = True
+        return cls(list(job_dict.keys()), eligibility)
+
+    @classmethod
+    def from_jobset(cls, jobs):
+        return cls(jobs.idx, jobs.eligibility)
+
+    def is_eligible(self, j, mc_id):
+        return (self.job_mask[j] >> mc_id) & 1 == 1
+
+    def machines_of(self, j):
+        '''
+        Return list of eligible machines of job j
+        '''
+        return self.job_machines[j]
+
+    def jobs_on(self, mc_id):
+        '''
+        Return set of unscheduled jobs eligible to machine mc_id
+        '''
+        return self.mc_jobs[mc_id]
+
+    def unscheduled_count(self, mc_id):
+        return len(self.mc_jobs[mc_id])
+
+    def set_scheduled(self, j):
+        '''
+        Remove job j from unscheduled jobs of its eligible machines
+        '''
+        for i in self.job_machines[j]:
+            self.mc_jobs[i].discard(j)
+
+    def mask_groups(self):
+        '''
+        Return {bitmask: list of jobs} grouping jobs by set of eligible machines
+        '''
+        groups: Dict[int, List[int]] = {}
+        for j, mask in self.job_mask.items():
+            groups.setdefault(mask, []).append(j)
+        return groups
@@ -5,6 +5,11 @@ Created in Feb 10th. 2019 by JuneTech
 
 import csv
 import math
+import os
+
+import numpy as np
+
+from jobset import JobSet
 from tct_parallel_mc import Problem, JobData
 
 
@@ -43,6 +48,53 @@ def jobinfo_feeder(run_param: Problem, data_location):
 
     return job_ins_dict
 
+def jobset_feeder(run_param: Problem, data_location, cache=False):
+    '''
+    reads job data file in bulk, returns JobSet
+    - cache: keep parsed arrays in a .npz file next to the CSV file,
+      used while size and modification time of the CSV file are unchanged
+    '''
+    filename = data_location + run_param.csv_filename()
+    if not cache:
+        return read_jobset_csv(filename, run_param.m)
+
+    csv_stat = os.stat(filename)
+    cache_filename = os.path.splitext(filename)[0] + ".npz"
+    try:
+        with np.load(cache_filename) as cached:
+            if int(cached["csv_size"]) == csv_stat.st_size and \
+               int(cached["csv_mtime_ns"]) == csv_stat.st_mtime_ns:
+                return JobSet(cached["idx"], cached["rj"], cached["eligibility"])
+    except (OSError, KeyError, ValueError):
+        pass ## no cache or unreadable cache
+
+    job_set = read_jobset_csv(filename, run_param.m)
+
+    ## write to temporary file first, other processes may read the cache
+    temp_filename = cache_filename + "." + str(os.getpid()) + ".tmp"
+    with open(temp_filename, 'wb') as cache_file:
+        np.savez(cache_file, idx=job_set.idx, rj=job_set.rj, eligibility=job_set.eligibility,
+                 csv_size=csv_stat.st_size, csv_mtime_ns=csv_stat.st_mtime_ns)
+    os.replace(temp_filename, cache_filename)
+
+    return job_set
+
+def read_jobset_csv(filename, mc_no):
+    '''
+    parses job data file into arrays at once, returns JobSet
+    '''
+    with open(filename, 'r') as csvfile:
+        header = next(csv.reader(csvfile, delimiter=','))
+        table = np.loadtxt(csvfile, delimiter=',', dtype=np.int64, ndmin=2)
+    column = {name.strip(): col for col, name in enumerate(header)}
+
+    eligibility = table[:, [column[str(i)] for i in range(1, mc_no+1)]]
+    if ((eligibility != 0) & (eligibility != 1)).any():
+        print("Invalid value(neither 0 nor 1) for machine eligibility")
+        raise ValueError
+
+    return JobSet(table[:, column['job_no']], table[:, column['release_date']], eligibility == 1)
+
 def main():
     RUN_OPTION_FILENAME = "run_option_small.json"
 
@@ -3,9 +3,20 @@ Visualizes result of scheduling,
 format of result being {i: {t : j}}, t representing time of job completion
 Created in Jun. 24. 2018 by JuneTech
 '''
+import csv
+import json
+from collections import namedtuple
+from itertools import chain
 
+import numpy as np
 from tqdm import tqdm
 
+from jobset import as_jobset
+
+## kind: "unknown_job", "unknown_machine", "duplicate_job", "missing_job",
+##       "eligibility", "release", "overlap" or "objective"
+Violation = namedtuple("Violation", ["kind", "job", "machine", "time", "detail"])
+
 def print_schedule_info(machine_job_sequence, p, is_tqdm=False):
     '''
     Visualizes result of scheduling,
@@ -60,6 +71,66 @@ def print_schedule_info(machine_job_sequence, p, is_tqdm=False):
         else:
             print(time_string)
 
+def print_schedule_intervals(machine_job_sequence, p, is_tqdm=False, per_line=8):
+    '''
+    Visualizes {i: {t : j}} schedule as job intervals per machine,
+    idle spans shown by their length, overlapping jobs marked with '!';
+    output grows with number of jobs, not with Cmax
+    '''
+    write = tqdm.write if is_tqdm else print
+
+    Cmax = max((max(time_job_dict) for time_job_dict in machine_job_sequence.values()
+                if time_job_dict), default=0)
+    write("Cmax: " + str(Cmax))
+
+    for mc_id, time_job_dict in machine_job_sequence.items():
+        segments = []
+        time_cursor = 0
+        for time in sorted(time_job_dict):
+            start = time - p
+            if start > time_cursor:
+                segments.append("~" + str(start - time_cursor) + "~")
+            mark = "!" if start < time_cursor else ""
+            segments.append(mark + "[" + str(start) + "," + str(time) + "):" + str(time_job_dict[time]))
+            time_cursor = time
+
+        prefix = str(mc_id).zfill(2) + "|"
+        if not segments:
+            write(prefix)
+        for first in range(0, len(segments), per_line):
+            write(prefix + " ".join(segments[first:first+per_line]))
+            prefix = "  |"
+
+SCHEDULE_CSV_COLUMNS = ["machine", "job", "start", "completion"]
+
+def write_schedule_csv_header(csvfile, info_names=()):
+    '''
+    Write header row of write_schedule_csv rows to an open CSV file
+    '''
+    writer = csv.writer(csvfile, delimiter=',', lineterminator='\n')
+    writer.writerow(list(info_names) + SCHEDULE_CSV_COLUMNS)
+
+def write_schedule_csv(machine_job_sequence, p, csvfile, info=()):
+    '''
+    Append rows info + [machine, job, start, completion] of every job
+    to an open CSV file
+    '''
+    writer = csv.writer(csvfile, delimiter=',', lineterminator='\n')
+    for mc_id, time_job_dict in machine_job_sequence.items():
+        writer.writerows(list(info) + [mc_id, job, time - p, time]
+                         for time, job in sorted(time_job_dict.items()))
+
+def write_schedule_jsonl(machine_job_sequence, p, jsonfile, info=None):
+    '''
+    Append one JSON object per job to an open JSON lines file,
+    fields of info dictionary added to every object
+    '''
+    info = info or {}
+    for mc_id, time_job_dict in machine_job_sequence.items():
+        for time, job in sorted(time_job_dict.items()):
+            record = dict(info, machine=mc_id, job=job, start=time - p, completion=time)
+            jsonfile.write(json.dumps(record) + "\n")
+
 def check_end_schedule_feasibility(mc_time_job_dict, job_dict, p):
     '''
     return False if machine eligibility or release date constraint is not kept
@@ -68,7 +139,7 @@ def check_end_schedule_feasibility(mc_time_job_dict, job_dict, p):
     return_bool = True
     for i, time_job_dict in mc_time_job_dict.items():
         for t, j in time_job_dict.items():
-            if i not in job_dict[j].mc_el:
+            if not job_dict[j].is_eligible(i):
                 print("Machine", i,
                       "\tdoes not belong to job", job_dict[j].idx,
                       "\twith eligibility:", job_dict[j].mc_el)
@@ -84,6 +155,84 @@ def check_end_schedule_feasibility(mc_time_job_dict, job_dict, p):
     else:
         raise SyntaxError
 
+def schedule_arrays(mc_time_job_dict):
+    '''
+    Return arrays of machine, completion time and job of every scheduled job
+    '''
+    count = sum(len(time_job_dict) for time_job_dict in mc_time_job_dict.values())
+    machine = np.fromiter(chain.from_iterable([i] * len(time_job_dict)
+                                              for i, time_job_dict in mc_time_job_dict.items()),
+                          dtype=np.int64, count=count)
+    time = np.fromiter(chain.from_iterable(mc_time_job_dict.values()), dtype=np.int64, count=count)
+    job = np.fromiter(chain.from_iterable(time_job_dict.values()
+                                          for time_job_dict in mc_time_job_dict.values()),
+                      dtype=np.int64, count=count)
+    return machine, time, job
+
+def validate_schedule(mc_time_job_dict, jobs, m, p, objective=None):
+    '''
+    Return list of Violation of {i: {t: j}} schedule, empty if feasible;
+    jobs given as JobSet or dictionary of JobData on m machines
+    (schedule may lack some machines), objective(if given)
+    compared with sum of completion times
+    '''
+    machine, time, job = schedule_arrays(mc_time_job_dict)
+    return validate_schedule_arrays(machine, time, job, as_jobset(jobs, m), p, objective)
+
+def validate_schedule_arrays(machine, time, job, jobs, p, objective=None):
+    '''
+    Return list of Violation of schedule given as arrays of
+    machine, completion time and job of every scheduled job
+    '''
+    violations = []
+    def add(kind, mask, detail=None):
+        for k in np.flatnonzero(mask).tolist():
+            violations.append(Violation(kind, int(job[k]), int(machine[k]), int(time[k]),
+                                        None if detail is None else int(detail[k])))
+
+    ## row of each scheduled job in jobs
+    if jobs.job_num() > 0 and jobs.idx.min() >= 0 and jobs.idx.max() < 4 * jobs.job_num():
+        ## job numbers are small, direct lookup table
+        row_of = np.zeros(int(jobs.idx.max()) + 1, dtype=np.int64)
+        row_of[jobs.idx] = np.arange(jobs.job_num())
+        row = row_of[np.clip(job, 0, len(row_of) - 1)]
+    else:
+        sorter = np.argsort(jobs.idx, kind="stable")
+        position = np.searchsorted(jobs.idx[sorter], job)
+        row = sorter[np.minimum(position, len(sorter) - 1)]
+    is_known_job = jobs.idx[row] == job
+    add("unknown_job", ~is_known_job)
+    is_known_machine = (machine >= 1) & (machine <= jobs.mc_num())
+    add("unknown_machine", ~is_known_machine)
+
+    ## completeness
+    scheduled_count = np.bincount(row[is_known_job], minlength=jobs.job_num())
+    add("duplicate_job", is_known_job & (scheduled_count[row] > 1))
+    for missing_row in np.flatnonzero(scheduled_count == 0).tolist():
+        violations.append(Violation("missing_job", int(jobs.idx[missing_row]), None, None, None))
+
+    ## eligibility & release date
+    is_checked = is_known_job & is_known_machine
+    is_eligible = np.ones(len(job), dtype=bool)
+    is_eligible[is_checked] = jobs.eligibility[row[is_checked], machine[is_checked] - 1]
+    add("eligibility", ~is_eligible)
+    add("release", is_known_job & (time - p < jobs.rj[row]), detail=jobs.rj[row])
+
+    ## jobs on one machine must be at least p apart
+    order = np.lexsort((time, machine))
+    is_overlap = (machine[order][1:] == machine[order][:-1]) & \
+                 (time[order][1:] - time[order][:-1] < p)
+    overlap_mask = np.zeros(len(job), dtype=bool)
+    overlap_mask[order[1:][is_overlap]] = True
+    previous_job = np.zeros(len(job), dtype=np.int64)
+    previous_job[order[1:]] = job[order[:-1]]
+    add("overlap", overlap_mask, detail=previous_job)
+
+    if objective is not None and int(time.sum()) != objective:
+        violations.append(Violation("objective", None, None, None, (objective, int(time.sum()))))
+
+    return violations
+
 def main():
     print("Result display starts")
     machine_job_sequence = {}
@@ -91,6 +240,7 @@ def main():
     machine_job_sequence[2] = {3 : 4, 6 : 5, 11 : 6}
     machine_job_sequence[3] = {5 : 7, 9 : 8}
     print_schedule_info(machine_job_sequence, 3)
+    print_schedule_intervals(machine_job_sequence, 3)
 
 if __name__ == '__main__':
     main()
@@ -21,6 +21,30 @@ class ParameterLists:
         self.number_of_copy = _number_of_copy
         self.total_ins_count = -1   ## Total instances in this run
         self.optimal_timelimit = -1     ## Time limit for optimal MIP model
+        self.assignment_engine = "gurobi"   ## Solver of IMR assignment problems: "gurobi", "matrix" or "flow"
+        self.greedy_engine = "scan"     ## Implementation of Algorithm Greedy: "scan" or "fast"
+        self.assignment_sparse = False  ## Create only feasible variables in assignment MIP;
+                                        ## same objective, but IMR/GIMR may differ when costs tie
+        self.optimal_compact = False    ## Compact formulation of optimal MIP model
+        self.imr_incremental = False    ## One assignment model reused over all IMR offsets;
+                                        ## same objectives, but IMR/GIMR may differ when costs tie
+        self.imr_workers = 1    ## Number of processes evaluating IMR offsets
+        self.imr_threads = 0    ## Gurobi thread cap of each IMR worker, no cap if 0
+        self.imr_prune = False  ## Skip IMR offsets that cannot improve the best one
+        self.imr_validation = "full"    ## Check of IMR schedules: "full", "sampled" or "off"
+        self.solve_cache_size = 64  ## Number of assignment solutions kept for reuse
+        self.batch_workers = 1  ## Number of processes solving instances
+        self.batch_threads = 0  ## Gurobi thread cap of each batch worker, no cap if 0
+        self.batch_ordered = True   ## Write result rows in instance order
+        self.resume_filename = ""   ## Result file of an interrupted run to continue, created if missing
+        self.instance_loader = "dict"   ## Source of instances: "dict", "bulk", "cached", "packed" or "generate"
+        self.packed_filename = ""   ## Packed dataset file read by "packed" instance loader, <param json>.pack if empty
+        self.generator_seed = 0     ## Seed of "generate" instance loader
+        self.header_phase = []  ## Phase timer keys written as extra result columns
+        self.schedule_filename = ""     ## File(.csv or .jsonl) receiving best schedule of every instance
+        self.exact_fast_path = False    ## Solve exactly solvable instances combinatorially, skipping MIPs;
+                                        ## with full_pipeline only exact_case is recorded
+        self.full_pipeline = False  ## Run every algorithm even when upper bound already equals lower bound
 
         self.set_total_ins_count()
         self.solved_ins_count = 0
@@ -39,8 +63,33 @@ class ParameterLists:
 
     def add_from_runoption(self, runoption):
         self.optimal_timelimit = runoption["optimal_timelimit"]
+        self.assignment_engine = runoption.get("assignment_engine", self.assignment_engine)
+        self.greedy_engine = runoption.get("greedy_engine", self.greedy_engine)
+        self.assignment_sparse = runoption.get("assignment_sparse", self.assignment_sparse)
+        self.optimal_compact = runoption.get("optimal_compact", self.optimal_compact)
+        self.imr_incremental = runoption.get("imr_incremental", self.imr_incremental)
+        self.imr_workers = runoption.get("imr_workers", self.imr_workers)
+        self.imr_threads = runoption.get("imr_threads", self.imr_threads)
+        self.imr_prune = runoption.get("imr_prune", self.imr_prune)
+        self.imr_validation = runoption.get("imr_validation", self.imr_validation)
+        self.solve_cache_size = runoption.get("solve_cache_size", self.solve_cache_size)
+        self.batch_workers = runoption.get("batch_workers", self.batch_workers)
+        self.batch_threads = runoption.get("batch_threads", self.batch_threads)
+        self.batch_ordered = runoption.get("batch_ordered", self.batch_ordered)
+        self.resume_filename = runoption.get("resume_filename", self.resume_filename)
+        self.instance_loader = runoption.get("instance_loader", self.instance_loader)
+        self.packed_filename = runoption.get("packed_filename", self.packed_filename)
+        self.generator_seed = runoption.get("generator_seed", self.generator_seed)
+        self.header_phase = runoption.get("header_phase", self.header_phase)
+        self.schedule_filename = runoption.get("schedule_filename", self.schedule_filename)
+        self.exact_fast_path = runoption.get("exact_fast_path", self.exact_fast_path)
+        self.full_pipeline = runoption.get("full_pipeline", self.full_pipeline)
 
-    def option_iterator(self, message_flag, sc, slack_data):
+    def option_iterator(self, message_flag, sc, slack_data, skip_keys=frozenset()):
+        '''
+        Yield Problem instances of all parameter combinations,
+        except for those with info_key() in skip_keys
+        '''
         from tqdm import tqdm
         if message_flag:
             import sendslack
@@ -61,7 +110,10 @@ class ParameterLists:
                     for dr in self.drs:
                         for dM in self.dMs:
                             for dup in range(self.number_of_copy):
-                                yield Problem(m, n_over_m, p, dr, dM, dup)
+                                prob = Problem(m, n_over_m, p, dr, dM, dup)
+                                if prob.info_key() in skip_keys:
+                                    continue
+                                yield prob
 
 class Result:
     '''
@@ -72,12 +124,18 @@ class Result:
         self.UB = {"Grd": -1, "IMR": -1, "GIMR": -1}
         self.UB_time = {"Grd": -1, "IMR": -1, "GIMR": -1}
 
-        # Lower bound objective value
-        self.LB = {"Z_L": -1, "no_el": -1, "LB": -1}
+        # Lower bound objective value;
+        # "LB" column is the Hall bound, never below no_el nor min(Z_L, no_el),
+        # so Z_L no longer changes LB and is solved only for its own column
+        self.LB = {"Z_L": -1, "no_el": -1, "Hall": -1, "LB": -1}
 
         # Optimal value & time
         self.opt = -1
         self.opt_time = -1.0
+        self.opt_status = '-'
+        self.opt_gap = '-'
+        self.exact_case = '-' # exactly solvable case found by exact_case.analyze_instance
+        self.skipped_stages = [] # algorithms not run since bounds proved optimality
         
         # Ratios
         self.ratio = {"Grd": -1.0, "IMR": -1.0, "GIMR": -1.0, "GIMR-LB": -1.0}
@@ -122,11 +180,58 @@ class Result:
         '''
         self.opt = obj
 
+    def set_opt_status(self, status, gap):
+        '''
+        Record termination status and MIP gap of optimal MIP
+        '''
+        self.opt_status = status
+        self.opt_gap = gap
+
+    def set_exact(self, case, obj, seconds):
+        '''
+        Record result of an exactly solved instance;
+        figures of algorithms not run are '-'
+        '''
+        self.exact_case = case
+        for key in self.UB.keys():
+            self.UB[key] = '-'
+            self.UB_time[key] = '-'
+        self.UB["GIMR"] = obj
+        for key in self.LB.keys():
+            self.LB[key] = '-'
+        self.LB["LB"] = obj
+        self.opt = obj
+        self.opt_time = seconds
+        self.opt_status = "exact"
+        self.opt_gap = 0
+        self.ratio = {"Grd": '-', "IMR": '-', "GIMR": 1.0, "GIMR-LB": 1.0}
+        self.both_same = '-'
+        self.IMR_better = '-'
+        self.Grd_better = '-'
+        self.skipped_stages = ["Grd", "no_el", "Hall", "IMR", "Z_L", "opt"]
+
+    def skip_stage(self, key):
+        '''
+        Record that algorithm of key(UB or LB key) was not run
+        '''
+        if key in self.UB:
+            self.UB[key] = '-'
+            self.UB_time[key] = '-'
+        else:
+            self.LB[key] = '-'
+        self.skipped_stages.append(key)
+
     def update_most_UB_LB(self):
         '''
-        Calcualte results for GIMR & LB
+        Calcualte results for GIMR & LB,
+        ignoring figures of algorithms not run('-')
         '''
-        if self.UB["Grd"] < self.UB["IMR"]:
+        if self.UB["IMR"] == '-':
+            self.UB["GIMR"] = self.UB["Grd"]
+            self.both_same = '-'
+            self.IMR_better = '-'
+            self.Grd_better = '-'
+        elif self.UB["Grd"] < self.UB["IMR"]:
             self.UB["GIMR"] = self.UB["Grd"]
             self.Grd_better = 1
         elif self.UB["Grd"] > self.UB["IMR"]:
@@ -136,19 +241,25 @@ class Result:
             self.UB["GIMR"] = self.UB["Grd"]
             self.both_same = 1
 
-        self.UB_time["GIMR"] = self.UB_time["Grd"] + self.UB_time["IMR"]
+        self.UB_time["GIMR"] = sum(self.UB_time[key] for key in ("Grd", "IMR")
+                                   if self.UB_time[key] != '-')
 
-        self.LB["LB"] = min(self.LB["Z_L"], self.LB["no_el"])
+        if self.LB["Hall"] != '-':
+            self.LB["LB"] = self.LB["Hall"]
+        else:
+            self.LB["LB"] = min(self.LB[key] for key in ("Z_L", "no_el") if self.LB[key] != '-')
 
         self.ratio["GIMR-LB"] = self.UB["GIMR"] / self.LB["LB"]
 
     def update_UB_ratio(self):
         '''
-        Calcualte UB/opt ratios
-        '''       
-        self.ratio["GIMR"] = self.UB["GIMR"] / self.opt
-        self.ratio["Grd"] = self.UB["Grd"] / self.opt
-        self.ratio["IMR"] = self.UB["IMR"] / self.opt
+        Calcualte UB/opt ratios, '-' for algorithms not run
+        '''
+        for key in ("GIMR", "Grd", "IMR"):
+            if self.UB[key] == '-' or self.opt == '-':
+                self.ratio[key] = '-'
+            else:
+                self.ratio[key] = self.UB[key] / self.opt
 
     def return_result_figures_list(self):
         '''
@@ -160,7 +271,9 @@ class Result:
         '''
         UB_list = []
         LB_list = []
-        opt_list = [self.opt, self.opt_time]
+        skipped_string = ";".join(self.skipped_stages) if self.skipped_stages else '-'
+        opt_list = [self.opt, self.opt_time, self.opt_status, self.opt_gap, self.exact_case,
+                    skipped_string]
         ratio_list = []
         comp_list = [self.both_same, self.IMR_better, self.Grd_better]
 
@@ -172,7 +285,7 @@ class Result:
         
         ratio_list.append(self.ratio["GIMR-LB"])
 
-        LB_key_list = ["Z_L", "no_el", "LB"]
+        LB_key_list = ["Z_L", "no_el", "Hall", "LB"]
         for key in LB_key_list:
             LB_list.append(self.LB[key])
         
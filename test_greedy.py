@@ -0,0 +1,36 @@
+'''
+Fast engine of Algorithm Greedy must give the same schedule as the original one
+on every instance of param_data_small
+    python -m pytest test_greedy.py
+'''
+import os
+
+import pytest
+
+import greedy as grs
+from jobset import JobSet
+from reader import jobinfo_feeder, json_return_dict
+from tct_parallel_mc import ParameterLists
+
+PACKAGE_LOCATION = os.path.dirname(os.path.abspath(__file__)) + os.sep
+PARAM_JSON_FILENAME = PACKAGE_LOCATION + "param_data_small.json"
+
+def small_instances():
+    param_filename_data = json_return_dict(PARAM_JSON_FILENAME)
+    param_data = ParameterLists(param_filename_data["number_of_machines"],
+                                param_filename_data["mn_ratios"],
+                                param_filename_data["processing_times"],
+                                param_filename_data["drs"],
+                                param_filename_data["dMs"],
+                                param_filename_data["number_of_copy"])
+    return list(param_data.option_iterator(False, 0, 0))
+
+@pytest.mark.parametrize("prob", small_instances(), ids=lambda prob: prob.csv_filename())
+def test_fast_engine_same_schedule(prob):
+    param_filename_data = json_return_dict(PARAM_JSON_FILENAME)
+    data_location = PACKAGE_LOCATION + param_filename_data["linux_data_location"]
+    job_dict = jobinfo_feeder(prob, data_location)
+
+    expected = grs.greedy_schedule(job_dict, prob)
+    assert grs.greedy_schedule_fast(job_dict, prob) == expected
+    assert grs.greedy_schedule_fast(JobSet.from_job_dict(job_dict, prob.m), prob) == expected